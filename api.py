@@ -1,14 +1,16 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
+import gzip
 import json
 import os
 from dotenv import load_dotenv
+from ratings_store import RATING_MAX, RATING_MIN, get_ratings_store
+from catalog_feed import CatalogFeed
+from leaderboard import LEADERBOARD_MAX_LIMIT, Leaderboard
 
 # Load environment variables
 load_dotenv()
 
-RATINGS_FILE = 'ratings.json'
-
 app = Flask(__name__)
 # Configure CORS to allow requests from the frontend domain
 CORS(app, resources={
@@ -22,28 +24,28 @@ CORS(app, resources={
     }
 })
 
+# Каталог раздаётся из единственного источника — beer_db.json в корне
+catalog_feed = CatalogFeed(os.getenv('BEER_DB_FILE', 'beer_db.json'))
+
+def catalog_base_ratings():
+    # {название: рейтинг из каталога} — априорные значения для топа
+    return {beer['name']: beer.get('rating') for beer in catalog_feed.current().records.values()}
+
+# Топ по байесовскому рейтингу; новые оценки этого процесса обновляют его на месте
+leaderboard = Leaderboard(get_ratings_store(), catalog_base_ratings)
+
 # Получить средний рейтинг по названию пива
 def get_avg_rating(beer_name):
-    if os.path.exists(RATINGS_FILE):
-        with open(RATINGS_FILE, 'r', encoding='utf-8') as f:
-            ratings = json.load(f)
-        if beer_name in ratings and ratings[beer_name]:
-            all_ratings = ratings[beer_name]
-            return round(sum(all_ratings) / len(all_ratings), 2)
-    return None
+    return get_ratings_store().average(beer_name)
+
+def valid_rating(rating):
+    # bool — подкласс int, поэтому сравниваем тип точно
+    return type(rating) is int and RATING_MIN <= rating <= RATING_MAX
 
 # Добавить новую оценку
 def save_rating(beer_name, rating):
-    if os.path.exists(RATINGS_FILE):
-        with open(RATINGS_FILE, 'r', encoding='utf-8') as f:
-            ratings = json.load(f)
-    else:
-        ratings = {}
-    if beer_name not in ratings:
-        ratings[beer_name] = []
-    ratings[beer_name].append(rating)
-    with open(RATINGS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(ratings, f, ensure_ascii=False, indent=2)
+    get_ratings_store().add(beer_name, rating)
+    leaderboard.record([(beer_name, rating)])
 
 @app.route('/rating', methods=['GET'])
 def get_rating():
@@ -58,11 +60,96 @@ def post_rating():
     data = request.get_json()
     beer_name = data.get('beer')
     rating = data.get('rating')
-    if not beer_name or not isinstance(rating, int):
-        return jsonify({'error': 'beer and int rating required'}), 400
+    if not beer_name or not valid_rating(rating):
+        return jsonify({'error': f'beer and int rating {RATING_MIN}..{RATING_MAX} required'}), 400
     save_rating(beer_name, rating)
     return jsonify({'status': 'ok'})
 
+# Ответы меньше этого размера не сжимаем: gzip-заголовки съедят выигрыш
+GZIP_MIN_SIZE = 1024
+# Максимум оценок в одном пакетном POST
+MAX_BATCH_RATINGS = 500
+
+def compact_json(data, status=200):
+    """Компактный JSON без пробелов; gzip, если клиент его принимает и ответ не крошечный."""
+    body = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    response = Response(body, status=status, mimetype='application/json')
+    response.vary.add('Accept-Encoding')
+    if len(body) >= GZIP_MIN_SIZE and 'gzip' in request.headers.get('Accept-Encoding', ''):
+        response.set_data(gzip.compress(body, compresslevel=6))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+def ratings_payload(totals):
+    # {имя: [средний рейтинг, число оценок]}
+    return {'ratings': {beer: [round(total / count, 2), count] for beer, (total, count) in totals.items()}}
+
+# Средние рейтинги пачкой: ?beer=A&beer=B, без параметров — по всем оценённым пивам
+@app.route('/ratings', methods=['GET'])
+def get_ratings():
+    beer_names = request.args.getlist('beer')
+    store = get_ratings_store()
+    totals = store.get_many(beer_names) if beer_names else store.all_totals()
+    return compact_json(ratings_payload(totals))
+
+# То же для длинных списков, которые не помещаются в URL: {"beers": [...]}
+@app.route('/ratings/query', methods=['POST'])
+def query_ratings():
+    data = request.get_json(silent=True) or {}
+    beer_names = data.get('beers')
+    if not isinstance(beer_names, list) or not all(isinstance(name, str) for name in beer_names):
+        return jsonify({'error': 'beers list required'}), 400
+    return compact_json(ratings_payload(get_ratings_store().get_many(beer_names)))
+
+# Несколько оценок одним запросом: {"ratings": [{"beer": ..., "rating": int}, ...]}
+@app.route('/ratings', methods=['POST'])
+def post_ratings():
+    data = request.get_json(silent=True) or {}
+    items = data.get('ratings')
+    if not isinstance(items, list) or not items or len(items) > MAX_BATCH_RATINGS:
+        return jsonify({'error': f'ratings list of 1..{MAX_BATCH_RATINGS} items required'}), 400
+    votes = []
+    for item in items:
+        beer_name = item.get('beer') if isinstance(item, dict) else None
+        rating = item.get('rating') if isinstance(item, dict) else None
+        if not beer_name or not valid_rating(rating):
+            return jsonify({'error': f'each item needs beer and int rating {RATING_MIN}..{RATING_MAX}'}), 400
+        votes.append((beer_name, rating))
+    get_ratings_store().add_many(votes)
+    leaderboard.record(votes)
+    return jsonify({'status': 'ok', 'saved': len(votes)})
+
+# Лучшие сорта: ?limit=N (по умолчанию 10)
+@app.route('/top', methods=['GET'])
+def get_top():
+    limit = request.args.get('limit', 10, type=int)
+    if not 1 <= limit <= LEADERBOARD_MAX_LIMIT:
+        return jsonify({'error': f'limit must be 1..{LEADERBOARD_MAX_LIMIT}'}), 400
+    return compact_json({
+        'top': leaderboard.top(limit),
+        'min_votes': leaderboard.min_votes,
+        'prior_weight': leaderboard.prior_weight,
+    })
+
+# Каталог с версией: ETag/If-None-Match -> 304, ?since=<версия> -> только изменения,
+# тела предсжаты (br, если установлен brotli, иначе gzip)
+@app.route('/catalog', methods=['GET'])
+def get_catalog():
+    current = catalog_feed.current()
+    since = request.args.get('since')
+    if since == current.version or request.if_none_match.contains(current.version):
+        response = Response(status=304)
+    else:
+        body = (catalog_feed.delta(since) if since else None) or current.body
+        data, encoding = body.pick(request.headers.get('Accept-Encoding', ''))
+        response = Response(data, mimetype='application/json')
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(current.version)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.vary.add('Accept-Encoding')
+    return response
+
 if __name__ == '__main__':
     port = int(os.getenv('PORT', 5001))
     # Only use debug mode in development
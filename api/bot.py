@@ -1,17 +1,36 @@
 import os
+import sys
+
+# Общие модули (каталог и т.п.) лежат в корне репозитория
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Первым, чтобы при STARTUP_PROFILE=1 замерить импорт всего остального
+import startup_profile
+
 import logging
 from dotenv import load_dotenv
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, Bot
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler
-# import pytesseract # Удаляем или комментируем эту строку
-from PIL import Image
-import io
+from telegram import (Update, InlineKeyboardButton, InlineKeyboardMarkup, Bot, InlineQueryResultArticle,
+                      InputTextMessageContent)
+from telegram.request import HTTPXRequest
+from telegram.ext import ContextTypes
 import re
-import requests
 import json
 import base64
-from rapidfuzz import fuzz, process
+import asyncio
 from flask import Flask, request
+from flask_cors import CORS
+
+# Тяжёлые зависимости (Pillow, numpy/rapidfuzz, OCR-клиенты) импортируются
+# лениво — в функциях, которым они нужны, чтобы текстовые команды на холодном
+# инстансе не платили за их загрузку
+import callbacks
+from cards import render_card, render_rating
+from leaderboard import Leaderboard
+from ratings_store import get_ratings_store
+from bot_runtime import runtime
+from update_queue import RETRY, WEBHOOK_MODE, UpdateQueue
+from update_dedup import UpdateDeduplicator
+from webapp_auth import verify_init_data
+from rate_limit import REJECT_GLOBAL, REJECT_USER, RecognitionLimiter
 
 # Load environment variables
 load_dotenv()
@@ -28,7 +47,17 @@ logger = logging.getLogger(__name__)
 # в переменные окружения на Vercel
 BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 OCR_SPACE_API_KEY = os.getenv('OCR_SPACE_API_KEY', 'YOUR_OCR_SPACE_API_KEY') # Замените \'YOUR_OCR_SPACE_API_KEY\' на более безопасное значение по умолчанию или уберите его
-RATINGS_FILE = 'ratings.json'
+# Размер пула keep-alive соединений к Telegram Bot API
+TELEGRAM_POOL_SIZE = int(os.getenv('TELEGRAM_POOL_SIZE', 16))
+# Секрет, переданный в setWebhook(secret_token=...); если задан, вебхук проверяет заголовок
+TELEGRAM_WEBHOOK_SECRET = os.getenv('TELEGRAM_WEBHOOK_SECRET')
+
+# Лимиты на распознавание фото: на пользователя и общий (каждое фото — платный вызов OCR)
+recognition_limiter = RecognitionLimiter()
+RATE_LIMIT_MESSAGES = {
+    REJECT_USER: "Вы отправляете фото слишком часто. Подождите немного и попробуйте снова.",
+    REJECT_GLOBAL: "Сейчас слишком много запросов на распознавание. Попробуйте через минуту.",
+}
 
 # Simple context class for manual handler calls
 class SimpleContext:
@@ -46,20 +75,42 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Send a message when the command /help is issued."""
     await update.message.reply_text(
         'Отправь мне фотографию пива, и я предоставлю информацию о нем, '
-        'включая название, отзывы, рейтинг и соотношение цена/качество.'
+        'включая название, отзывы, рейтинг и соотношение цена/качество. '
+        '/top — лучшие сорта по оценкам пользователей.'
     )
 
+# Сколько сортов показывать в /top
+TOP_COMMAND_LIMIT = 10
+
+async def top_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Send the top-rated beers when the command /top is issued."""
+    top = get_leaderboard().top(TOP_COMMAND_LIMIT)
+    if not top:
+        await update.message.reply_text('Пока слишком мало оценок для рейтинга. Оцените пиво после распознавания!')
+        return
+    lines = ['🏆 Лучшие сорта по оценкам:']
+    for place, item in enumerate(top, 1):
+        lines.append(f"{place}. {item['beer']} — {item['score']}/10 (оценок: {item['votes']})")
+    await update.message.reply_text('\n'.join(lines))
+
 async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle incoming photos."""
     try:
-        # Get the photo file
-        photo = await update.message.photo[-1].get_file()
+        reason = await recognition_limiter.acquire(update.effective_user.id)
+        if reason:
+            await update.message.reply_text(RATE_LIMIT_MESSAGES[reason])
+            return
+
+        from image_prep import choose_photo_size
+
+        # Берём самый маленький размер, которого достаточно для распознавания
+        photo = await choose_photo_size(update.message.photo).get_file()
         
         # Download the photo
         photo_bytes = await photo.download_as_bytearray()
         
         # Используем OCR.Space вместо pytesseract
-        text = ocr_space_recognize(photo_bytes)
+        text = await ocr_space_recognize(photo_bytes)
         print(f"[DEBUG] Распознанный текст (OCR.Space): {repr(text)}")
         
         if not text.strip():
@@ -80,11 +131,14 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         # Format and send the response
         response_text = format_beer_info(beer_info)
-        # Кнопка для оценки
-        keyboard = [
-            [InlineKeyboardButton("Оценить", callback_data=f"rate_{beer_info['name']}")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        # Кнопка для оценки: по id из каталога; для пива не из каталога — по названию, если оно влезает в 64 байта
+        if beer_info.get('id'):
+            rate_data = callbacks.encode_rate(beer_info['id'])
+        else:
+            rate_data = f"rate_{beer_info['name']}"
+        reply_markup = None
+        if callbacks.fits(rate_data):
+            reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton("Оценить", callback_data=rate_data)]])
         await update.message.reply_text(response_text, reply_markup=reply_markup)
         
     except Exception as e:
@@ -94,23 +148,77 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "Пожалуйста, попробуйте еще раз."
         )
 
+def resolve_callback_beer(data: 'callbacks.Callback'):
+    """Название пива и его id в каталоге для кнопки; (None, None), если id больше нет в каталоге."""
+    from catalog import get_catalog
+
+    snapshot = get_catalog().snapshot()
+    if data.beer_id is not None:
+        beer = snapshot.beer(data.beer_id)
+        return (beer['name'], data.beer_id) if beer is not None else (None, None)
+    return data.beer_name, snapshot.id_by_name(data.beer_name)
+
 async def rate_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
-    if query.data.startswith('rate_'):
-        beer_name = query.data[5:]
-        # Кнопки с оценками 1-10
+    data = callbacks.decode(query.data)
+    if data is None:
+        return
+    beer_name, beer_id = resolve_callback_beer(data)
+    if beer_name is None:
+        await query.edit_message_reply_markup(reply_markup=None)
+        await query.message.reply_text("Этого пива больше нет в каталоге, оценка не сохранена.")
+        return
+    if data.action == callbacks.RATE:
+        # Кнопки с оценками 1-10; старые кнопки тоже переводим на id, если пиво есть в каталоге
+        def encode(i):
+            if beer_id is not None:
+                return callbacks.encode_set_rate(beer_id, i)
+            return f"setrate_{beer_name}_{i}"
+        if not callbacks.fits(encode(10)):
+            await query.message.reply_text("Не получается оценить это пиво: слишком длинное название.")
+            return
         keyboard = [
-            [InlineKeyboardButton(str(i), callback_data=f"setrate_{beer_name}_{i}") for i in range(1, 6)],
-            [InlineKeyboardButton(str(i), callback_data=f"setrate_{beer_name}_{i}") for i in range(6, 11)]
+            [InlineKeyboardButton(str(i), callback_data=encode(i)) for i in range(1, 6)],
+            [InlineKeyboardButton(str(i), callback_data=encode(i)) for i in range(6, 11)]
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
         await query.edit_message_reply_markup(reply_markup=reply_markup)
-    elif query.data.startswith('setrate_'):
-        _, beer_name, rating = query.data.split('_')
-        save_rating(beer_name, int(rating))
+    elif data.action == callbacks.SET_RATE:
+        # callback_data присылает клиент — оценку вне кнопок 1-10 не сохраняем
+        if not 1 <= data.rating <= 10:
+            return
+        save_rating(beer_name, data.rating)
         await query.edit_message_reply_markup(reply_markup=None)
-        await query.message.reply_text(f"Спасибо! Ваша оценка {rating}/10 учтена для {beer_name}.")
+        await query.message.reply_text(f"Спасибо! Ваша оценка {data.rating}/10 учтена для {beer_name}.")
+
+# Сколько секунд Telegram может кэшировать ответ на inline-запрос
+INLINE_CACHE_TIME = int(os.getenv('INLINE_CACHE_TIME', 30))
+
+async def inline_query_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Поиск по каталогу в inline-режиме: @bot corona."""
+    from inline_search import get_inline_index
+
+    query = update.inline_query
+    index = get_inline_index()
+    snapshot = index.snapshot
+    page, next_offset = index.search(query.query, query.offset)
+    beers = [snapshot.beers[idx] for idx in page]
+    totals = get_ratings_store().get_many(beer['name'] for beer in beers)
+    results = []
+    for idx, beer in zip(page, beers):
+        total, count = totals.get(beer['name'], (0, 0))
+        rating = combine_rating(total, count, beer.get('rating', '-'))
+        # Статичная часть карточки уже отрендерена в снимке каталога
+        card = snapshot.card(snapshot.ids[idx]) + render_rating(rating)
+        summary = ', '.join(str(beer[key]) for key in ('brand', 'style', 'abv') if beer.get(key))
+        results.append(InlineQueryResultArticle(
+            id=snapshot.ids[idx],
+            title=beer['name'],
+            description=summary or None,
+            input_message_content=InputTextMessageContent(card, parse_mode='MarkdownV2'),
+        ))
+    await query.answer(results, next_offset=next_offset, cache_time=INLINE_CACHE_TIME)
 
 async def webapp_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Send a button to open the Telegram Mini App (Web App)."""
@@ -138,10 +246,15 @@ async def webapp_data_handler(update: Update, context: ContextTypes.DEFAULT_TYPE
         elif payload.get('action') == 'process_photo' and payload.get('image_base64'):
             image_base64 = payload.get('image_base64')
             try:
+                reason = await recognition_limiter.acquire(update.effective_user.id)
+                if reason:
+                    await update.effective_message.reply_text(RATE_LIMIT_MESSAGES[reason])
+                    return
+
                 image_bytes = base64.b64decode(image_base64)
                 
                 # Process the image bytes (OCR and get beer info)
-                text = ocr_space_recognize(image_bytes)
+                text = await ocr_space_recognize(image_bytes)
                 print(f"[DEBUG] Распознанный текст (OCR.Space) from web app: {repr(text)}")
 
                 beer_info = {}
@@ -172,43 +285,20 @@ async def webapp_data_handler(update: Update, context: ContextTypes.DEFAULT_TYPE
 def normalize(text):
     return re.sub(r'[^a-zA-Zа-яА-Я0-9 ]', '', text.lower())
 
-def clean_name(name):
-    # Удаляем лишние слова и символы, которые не влияют на идентификацию бренда/названия
-    name = name.lower()
-    # Удаляем слова 'пиво', 'напиток пивной', 'темное', 'светлое', 'безалкогольное', 'полусухой', 'вишневый', 'оригинал', 'premium', 'draught', 'lager', 'hell', 'blonde', 'blanche', 'pale', 'extra', 'original', 'fresh', 'rouge', 'nastro', 'azzurro', 'sport', 'port', 'weissbier', 'ipa', 'эль', 'стаут', 'бланш', 'пилзнер', 'американский', 'европейский', 'немецкий', 'бельгийский', 'индийский', 'фруктовый', 'красное', 'светлый', 'темный', 'банка', 'стеклянная бутылка', 'бутылка', 'банка', 'фильтрованное', 'нефильтрованное', 'да', 'нет', 'импорт', 'вкусовое', 'безалкогольный', 'безалкогольное', 'мл', 'л'
-    words_to_remove = r'(пиво|напиток пивной|темное|светлое|безалкогольное|полусухой|вишневый|оригинал|premium|draught|lager|hell|blonde|blanche|pale|extra|original|fresh|rouge|nastro|azzurro|sport|port|weissbier|ipa|эль|стаут|бланш|пилзнер|американский|европейский|немецкий|бельгийский|индийский|фруктовый|красное|светлый|темный|банка|стеклянная бутылка|бутылка|фильтрованное|нефильтрованное|да|нет|импорт|вкусовое|безалкогольный|безалкогольное|мл|л)'
-    name = re.sub(words_to_remove, '', name)
-    # Удаляем числа (объемы)
-    name = re.sub(r'\d+[.,]?\d*', '', name)
-    # Удаляем лишние запятые, пробелы
-    name = re.sub(r'[\s,]+', ' ', name)
-    return name.strip()
+# Атрибуты из каталога, которые попадают в карточку и в JSON-ответ распознавания
+BEER_ATTRIBUTES = ('brand', 'country', 'volume', 'abv', 'style', 'density', 'color',
+                   'package', 'filtration', 'imported', 'flavored')
 
 def get_beer_info(beer_text: str) -> dict:
     """
     Поиск наиболее похожего пива в базе по строкам распознанного текста (fuzzy search, с нормализацией и очисткой названий).
     """
-    with open('beer_db.json', encoding='utf-8') as f:
-        beers = json.load(f)
-    beer_names = [beer['name'] for beer in beers]
-    norm_beer_names = [clean_name(name) for name in beer_names]
-    best_score = 0
-    best_idx = None
-    best_line = None
-    for line in beer_text.splitlines():
-        line = line.strip()
-        if not line:
-            continue
-        norm_line = clean_name(line)
-        match, score, idx = process.extractOne(norm_line, norm_beer_names, scorer=fuzz.token_sort_ratio)
-        print(f"[DEBUG] Fuzzy match: '{line}' -> '{beer_names[idx]}' (score={score})")
-        if score > best_score:
-            best_score = score
-            best_idx = idx
-            best_line = line
-    if best_score > 30 and best_idx is not None:
-        beer = beers[best_idx]
-        return {
+    from catalog import get_catalog, sku_id
+
+    best_score, beer, best_line = get_catalog().match(beer_text.splitlines())
+    if best_score > 30 and beer is not None:
+        beer_info = {
+            "id": sku_id(beer),
             "name": beer['name'],
             "description": beer['description'],
             "rating": beer['rating'],
@@ -217,104 +307,181 @@ def get_beer_info(beer_text: str) -> dict:
                 "Хорошее соотношение цена/качество",
                 "Рекомендую попробовать"
             ],
-            "price_quality_ratio": "Высокое"
+            "price_quality_ratio": "Высокое",
+            "match_score": round(best_score, 1),
         }
+        beer_info.update({key: beer[key] for key in BEER_ATTRIBUTES if beer.get(key)})
+        return beer_info
     else:
         return {
             "name": beer_text.strip().splitlines()[0] if beer_text.strip().splitlines() else beer_text.strip(),
             "description": "Пиво не найдено в базе. Попробуйте другое фото или название.",
             "rating": "-",
             "reviews": [],
-            "price_quality_ratio": "-"
+            "price_quality_ratio": "-",
+            "match_score": round(best_score, 1),
         }
 
-def escape_markdown_v2(text: str) -> str:
-    """Escape Telegram MarkdownV2 special characters (char-by-char)."""
-    escape_chars = '_*[]()~`>#+-=|{}.!'
-    return ''.join(f'\\{c}' if c in escape_chars else c for c in text)
-
 def format_beer_info(beer_info: dict) -> str:
     """Формирует подробное сообщение о пиве с MarkdownV2."""
-    lines = [f"🍺 *{escape_markdown_v2(beer_info.get('name', '-'))}*"]
-    if beer_info.get('brand'):
-        lines.append(f"🏷 *Бренд:* {escape_markdown_v2(beer_info['brand'])}")
-    if beer_info.get('country'):
-        lines.append(f"🌍 *Страна:* {escape_markdown_v2(beer_info['country'])}")
-    if beer_info.get('abv'):
-        lines.append(f"💪 *Крепость:* {escape_markdown_v2(str(beer_info['abv']))}%")
-    if beer_info.get('style'):
-        lines.append(f"🍻 *Сорт:* {escape_markdown_v2(beer_info['style'])}")
-    if beer_info.get('color'):
-        lines.append(f"🎨 *Цвет:* {escape_markdown_v2(beer_info['color'])}")
-    if beer_info.get('volume'):
-        lines.append(f"🧃 *Объем:* {escape_markdown_v2(str(beer_info['volume']))} мл")
-    if beer_info.get('package'):
-        lines.append(f"📦 *Упаковка:* {escape_markdown_v2(beer_info['package'])}")
-    if beer_info.get('filtration'):
-        lines.append(f"🧊 *Фильтрация:* {escape_markdown_v2(beer_info['filtration'])}")
-    if beer_info.get('imported'):
-        lines.append(f"🌐 *Импорт:* {escape_markdown_v2(beer_info['imported'])}")
-    if beer_info.get('flavored'):
-        lines.append(f"🍯 *Вкусовое:* {escape_markdown_v2(beer_info['flavored'])}")
-    lines.append(f"\n📝 *Описание:*\n{escape_markdown_v2(beer_info.get('description', '-'))}")
-    lines.append(f"\n⭐ *Рейтинг:* {beer_info.get('rating', '-')} /10")
-    return '\n'.join(lines)
-
-def ocr_space_recognize(image_bytes: bytes) -> str:
-    """Send image to OCR.Space API and return recognized text."""
-    url = 'https://api.ocr.space/parse/image'
-    payload = {
-        'apikey': OCR_SPACE_API_KEY,
-        'language': 'eng',
-        'isOverlayRequired': False
-    }
-    files = {'file': ('image.jpg', image_bytes)}
-    response = requests.post(url, data=payload, files=files)
-    result = response.json()
-    if result.get('IsErroredOnProcessing'):
-        return ''
-    parsed_results = result.get('ParsedResults')
-    if parsed_results and len(parsed_results) > 0:
-        return parsed_results[0].get('ParsedText', '')
-    return ''
+    card = None
+    if beer_info.get('id'):
+        from catalog import get_catalog
+        # Статичная часть карточки записи каталога рендерится один раз, подставляется только рейтинг
+        card = get_catalog().snapshot().card(beer_info['id'])
+    if card is None:
+        return render_card(beer_info)
+    return card + render_rating(beer_info.get('rating', '-'))
+
+_ocr_client = None
+
+def get_ocr_client() -> 'OcrSpaceClient':
+    """Общий для процесса клиент OCR.Space."""
+    global _ocr_client
+    if _ocr_client is None:
+        from ocr_client import OcrSpaceClient
+        _ocr_client = OcrSpaceClient(OCR_SPACE_API_KEY)
+    return _ocr_client
+
+def catalog_score(text: str) -> float:
+    """Оценка (0-100) лучшего совпадения распознанного текста с каталогом."""
+    from catalog import get_catalog
+
+    score, _, _ = get_catalog().match(text.splitlines())
+    return score
+
+_ocr_backend = None
+
+def get_ocr_backend() -> 'OcrBackend':
+    """OCR-движок процесса согласно политике OCR_BACKEND (remote / local / local_first)."""
+    global _ocr_backend
+    if _ocr_backend is None:
+        from ocr_backends import FanOutOcrBackend, RemoteOcrBackend, RoutingOcrBackend, TesseractOcrBackend
+        # OCR.Space опрашивается сразу на всех языках из OCR_LANGUAGES,
+        # ответы оцениваются совпадением с каталогом
+        remote = FanOutOcrBackend(RemoteOcrBackend(get_ocr_client()), catalog_score)
+        _ocr_backend = RoutingOcrBackend(TesseractOcrBackend(), remote)
+    return _ocr_backend
+
+_ocr_cache = None
+
+def get_ocr_cache() -> 'OcrCache':
+    """Общий для процесса кэш результатов OCR."""
+    global _ocr_cache
+    if _ocr_cache is None:
+        from ocr_cache import OcrCache
+        _ocr_cache = OcrCache()
+    return _ocr_cache
+
+async def ocr_space_recognize(image_bytes: bytes) -> str:
+    """Recognize text on the image with the configured OCR backend (OCR.Space by default)."""
+    from image_prep import OCR_PREPROCESS, preprocess
+    from ocr_backends import OCR_LANGUAGES
+    from ocr_cache import image_hash
+
+    # Ключ кэша зависит от набора языков: результат веера может отличаться от одного языка
+    language = ','.join(OCR_LANGUAGES)
+    if OCR_PREPROCESS:
+        # Pillow отпускает GIL, поэтому предобработка в потоке не блокирует event loop
+        image_bytes = await asyncio.to_thread(preprocess, image_bytes)
+    try:
+        value = image_hash(image_bytes)
+    except Exception as e:
+        # Pillow не смог открыть файл — отправляем как есть, без кэша
+        logger.warning(f"Cannot hash image for OCR cache: {e}")
+        value = None
+    cache = get_ocr_cache()
+    if value is not None:
+        text = cache.get(value, language)
+        if text is not None:
+            return text
+    result = await get_ocr_backend().recognize(image_bytes, language=language)
+    logger.info(f"OCR by {result.engine} (confidence={result.confidence})")
+    text = result.text
+    if value is not None and text.strip():
+        cache.put(value, language, text)
+    return text
+
+def catalog_base_ratings() -> dict:
+    """{название: рейтинг из каталога} — априорные значения для топа."""
+    from catalog import get_catalog
+
+    return {beer['name']: beer.get('rating') for beer in get_catalog().snapshot().beers}
+
+_leaderboard = None
+
+def get_leaderboard() -> Leaderboard:
+    """Общий для процесса топ; строится при первом запросе."""
+    global _leaderboard
+    if _leaderboard is None:
+        _leaderboard = Leaderboard(get_ratings_store(), catalog_base_ratings)
+    return _leaderboard
 
 def save_rating(beer_name: str, rating: int):
-    if os.path.exists(RATINGS_FILE):
-        with open(RATINGS_FILE, 'r', encoding='utf-8') as f:
-            ratings = json.load(f)
-    else:
-        ratings = {}
-    if beer_name not in ratings:
-        ratings[beer_name] = []
-    ratings[beer_name].append(rating)
-    with open(RATINGS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(ratings, f, ensure_ascii=False, indent=2)
+    get_ratings_store().add(beer_name, rating)
+    get_leaderboard().record([(beer_name, rating)])
 
 def get_avg_rating(beer_name: str, base_rating: float) -> float:
-    if os.path.exists(RATINGS_FILE):
-        with open(RATINGS_FILE, 'r', encoding='utf-8') as f:
-            ratings = json.load(f)
-        if beer_name in ratings and ratings[beer_name]:
-            all_ratings = ratings[beer_name]
-            return round((sum(all_ratings) + base_rating) / (len(all_ratings) + 1), 2)
-    return base_rating
-
-# Инициализация Flask приложения
-app = Flask(__name__)
-
-# Маршрут для приема вебхуков от Telegram
-# Vercel будет направлять POST запросы на этот маршрут, как указано в vercel.json
-@app.route('/', methods=['POST'])
-async def webhook():
-    logger.info("Webhook received!")
-    # Получаем JSON данные из запроса
-    data = request.get_json(force=True)
-    # Создаем объект Update из JSON данных
-    bot = Bot(BOT_TOKEN)
+    total, count = get_ratings_store().get(beer_name)
+    return combine_rating(total, count, base_rating)
+
+def combine_rating(total, count, base_rating):
+    """Рейтинг каталога с учётом пользовательских оценок (сумма и количество)."""
+    if not count:
+        return base_rating
+    if isinstance(base_rating, (int, float)):
+        return round((total + base_rating) / (count + 1), 2)
+    # В каталоге рейтинга нет ('' или '-') — среднее только по пользовательским оценкам
+    return round(total / count, 2)
+
+_bot = None
+_bot_lock = None
+
+async def get_bot() -> Bot:
+    """
+    Один инициализированный Bot на процесс с пулом keep-alive соединений.
+    Живёт в фоновом цикле runtime, поэтому TLS-соединения к Telegram
+    переиспользуются между запросами.
+    """
+    global _bot, _bot_lock
+    if _bot is None:
+        if _bot_lock is None:
+            _bot_lock = asyncio.Lock()
+        async with _bot_lock:
+            if _bot is None:
+                request = HTTPXRequest(connection_pool_size=TELEGRAM_POOL_SIZE)
+                bot = Bot(BOT_TOKEN, request=request)
+                await bot.initialize()
+                _bot = bot
+    return _bot
+
+async def shutdown_clients():
+    """Закрывает общие клиенты процесса (Telegram и OCR) при остановке."""
+    global _bot, _ocr_backend
+    if _bot is not None:
+        await _bot.shutdown()
+        _bot = None
+    if _ocr_backend is not None:
+        await _ocr_backend.aclose()
+        _ocr_backend = None
+
+runtime.add_shutdown_hook(shutdown_clients)
+
+# Повторные доставки одного update (и одного нажатия кнопки) обрабатываются один раз
+update_dedup = UpdateDeduplicator()
+
+async def process_update(data: dict):
+    """Разбирает update от Telegram и передаёт его нужному обработчику."""
+    bot = await get_bot()
     update = Update.de_json(data, bot) # Pass the bot instance to the Update object
-    
-    # Create a bot instance within the webhook function
     context = SimpleContext(bot=bot) # Use our custom context class
+    await dispatch_update(update, context)
+
+async def dispatch_update(update: Update, context):
+    """Маршрутизация update по обработчикам; общая для Flask-вебхука и bot_server.py."""
+    if update.callback_query and update_dedup.check_and_mark(f'cq:{update.callback_query.id}'):
+        logger.info(f"Duplicate callback query {update.callback_query.id}, skipping")
+        return
 
     try:
         if update.message:
@@ -326,16 +493,19 @@ async def webhook():
                     await help_command(update, context)
                 elif text == '/webapp':
                     await webapp_command(update, context)
+                elif text == '/top':
+                    await top_command(update, context)
                 else: # Добавляем обработку для всех остальных текстовых сообщений
-                    await update.message.reply_text("Я могу обрабатывать только команды /start, /help, /webapp, или фотографии пива.")
+                    await update.message.reply_text("Я могу обрабатывать только команды /start, /help, /webapp, /top, или фотографии пива.")
             elif update.message.photo:
                 await handle_photo(update, context)
             # Add other message types handlers here (e.g., update.message.document)
         elif update.callback_query:
             await rate_callback(update, context)
+        elif update.inline_query:
+            await inline_query_handler(update, context)
         elif update.effective_message and update.effective_message.web_app_data:
              await webapp_data_handler(update, context)
-        # Add other update types handlers here (e.g., update.inline_query)
         
     except Exception as e:
         logger.error(f"Error processing update: {e}")
@@ -343,12 +513,150 @@ async def webhook():
         # if update.effective_message:
         #     await update.effective_message.reply_text("Произошла ошибка при обработке вашего запроса.")
 
+# Очередь для режима WEBHOOK_MODE=queue; при остановке сначала дорабатывает
+# принятые update-ы (хуки выполняются в обратном порядке), потом закрываются клиенты
+update_queue = UpdateQueue(process_update)
+runtime.add_shutdown_hook(update_queue.drain)
+
+# Максимальный размер загружаемого фото; Werkzeug разбирает multipart потоково
+# и обрывает запрос с 413, как только тело превышает лимит
+RECOGNIZE_MAX_BYTES = int(os.getenv('RECOGNIZE_MAX_BYTES', 10 * 1024 * 1024))
+
+# Инициализация Flask приложения
+app = Flask(__name__)
+app.config['MAX_CONTENT_LENGTH'] = RECOGNIZE_MAX_BYTES
+
+# Мини-приложение живёт на другом домене и обращается к боту из браузера
+WEBAPP_ORIGINS = os.getenv(
+    'WEBAPP_ORIGINS', 'https://frontend-telegram-webapp.vercel.app,http://localhost:3000'
+).split(',')
+CORS(app, resources={
+    r"/(recognize|upload_photo)": {
+        "origins": WEBAPP_ORIGINS,
+        "methods": ["POST", "OPTIONS"],
+        "allow_headers": ["Content-Type"]
+    }
+})
+
+# Маршрут для приема вебхуков от Telegram
+# Vercel будет направлять POST запросы на этот маршрут, как указано в vercel.json
+@app.route('/', methods=['POST'])
+def webhook():
+    logger.info("Webhook received!")
+    if TELEGRAM_WEBHOOK_SECRET and request.headers.get('X-Telegram-Bot-Api-Secret-Token') != TELEGRAM_WEBHOOK_SECRET:
+        return 'forbidden', 403
+    # Получаем JSON данные из запроса
+    data = request.get_json(force=True, silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get('update_id'), int):
+        return 'bad update', 400
+    dedup_key = f"u:{data['update_id']}"
+    if update_dedup.check_and_mark(dedup_key):
+        # Повторная доставка: подтверждаем, ничего не делая
+        logger.info(f"Duplicate update {data['update_id']}, skipping")
+        return 'ok'
+    if WEBHOOK_MODE == 'queue':
+        # Быстрый ответ: update обработают воркеры очереди
+        if runtime.run(update_queue.put(data)) == RETRY:
+            # Telegram повторит доставку позже — тогда update не должен считаться дубликатом
+            update_dedup.forget(dedup_key)
+            return 'busy', 503
+        return 'ok'
+    # Обработка идёт в общем фоновом цикле, где живут Bot и OCR-клиент
+    try:
+        runtime.run(process_update(data))
+    except Exception:
+        # Telegram повторит доставку после ошибки — повтор не должен отброситься как дубликат
+        update_dedup.forget(dedup_key)
+        raise
+
     # Возвращаем ответ 'ok' Telegram
     return 'ok'
 
+# Время до первого ответа процесса (при STARTUP_PROFILE=1)
+@app.after_request
+def mark_first_response(response):
+    startup_profile.mark_first_response(f'{request.method} {request.path}')
+    return response
+
+# Метрики кэша OCR, очереди update-ов и лимитов, чтобы подбирать их размеры
+@app.route('/stats', methods=['GET'])
+def stats():
+    data = {
+        # Кэш OCR тянет Pillow — не создаём его ради статистики, пока он не понадобился
+        "ocr_cache": _ocr_cache.stats() if _ocr_cache is not None else None,
+        "update_queue": update_queue.stats(),
+        "dedup": update_dedup.stats(),
+        "rate_limit": recognition_limiter.metrics(),
+        "leaderboard": _leaderboard.stats() if _leaderboard is not None else None,
+        "startup": startup_profile.stats(),
+    }
+    return json.dumps(data), 200, {'Content-Type': 'application/json'}
+
+async def recognize_photo(image_bytes: bytes) -> dict:
+    """OCR + поиск по каталогу + пользовательский рейтинг; возвращает beer_info."""
+    # Use existing photo processing logic
+    text = await ocr_space_recognize(image_bytes)
+    print(f"[DEBUG] Распознанный текст (OCR.Space) from upload: {repr(text)}")
+
+    beer_info = {}
+    if text.strip():
+        beer_info = get_beer_info(text)
+        # Update rating with user ratings (if applicable)
+        beer_info['rating'] = get_avg_rating(beer_info.get('name', ''), beer_info.get('rating', '-')) # Pass default value for get_avg_rating
+    else:
+         beer_info = {"name": "-", "description": "Не удалось распознать текст.", "rating": "-", "reviews": [], "price_quality_ratio": "-", "match_score": 0}
+    return beer_info
+
+async def send_beer_info(user_id: str, beer_info: dict):
+    """Отправляет карточку пива в чат пользователя."""
+    bot = await get_bot()
+    response_text = format_beer_info(beer_info)
+    # You might want to add inline keyboard for rating here too
+    await bot.send_message(chat_id=user_id, text=response_text, parse_mode='MarkdownV2')
+
+async def recognize_and_send(image_bytes: bytes, user_id: str):
+    """Распознаёт фото из мини-приложения и отправляет результат в чат; возвращает (тело, статус)."""
+    reason = await recognition_limiter.acquire(user_id)
+    if reason:
+        return json.dumps({"status": "error", "message": RATE_LIMIT_MESSAGES[reason], "reason": reason}), 429
+
+    beer_info = await recognize_photo(image_bytes)
+
+    # Send result back to the user in chat
+    try:
+         await send_beer_info(user_id, beer_info)
+    except Exception as send_e:
+         logger.error(f"Error sending message to user {user_id}: {send_e}")
+         return json.dumps({"status": "error", "message": "Failed to send message to Telegram chat."}), 500
+
+    return json.dumps({"status": "success", "message": "Photo processed and info sent to chat."}), 200
+
+async def recognize_for_client(image_bytes: bytes, user_key: str):
+    """Распознаёт фото для /recognize; возвращает (beer_info или None, HTTP-статус, причина отказа)."""
+    reason = await recognition_limiter.acquire(user_key)
+    if reason:
+        return None, 429, reason
+    return await recognize_photo(image_bytes), 200, None
+
+async def send_beer_info_quietly(user_id: str, beer_info: dict):
+    # Отправка в чат идёт в фоне после ответа клиенту, поэтому ошибки только логируем
+    try:
+        await send_beer_info(user_id, beer_info)
+    except Exception as e:
+        logger.error(f"Error sending message to user {user_id}: {e}")
+
+def webapp_user_id(init_data):
+    """
+    id пользователя из подписанного Telegram initData или None. Поле user_id
+    из формы не используется: его можно подделать, чтобы обойти лимит или
+    отправить сообщение в чужой чат.
+    """
+    user = verify_init_data(init_data, BOT_TOKEN)
+    return user['id'] if user else None
+
 # New route for photo uploads from the mini app
 @app.route('/upload_photo', methods=['POST'])
-async def upload_photo():
+def upload_photo():
     logger.info("Photo upload request received!")
     try:
         # Get the photo file from the request
@@ -361,39 +669,65 @@ async def upload_photo():
             logger.error("No selected file.")
             return json.dumps({"status": "error", "message": "No selected file."}), 400
 
-        # Get user_id from form data
-        user_id = request.form.get('user_id')
+        # User is taken from the signed Telegram initData, not from a form field
+        user_id = webapp_user_id(request.form.get('init_data'))
         if not user_id:
-             logger.error("No user_id in form data.")
-             return json.dumps({"status": "error", "message": "User ID not provided."}), 400
+             logger.error("No valid init_data in form data.")
+             return json.dumps({"status": "error", "message": "Valid Telegram init_data not provided."}), 403
         
         # Read file bytes
         image_bytes = file.read()
 
-        # Use existing photo processing logic
-        text = ocr_space_recognize(image_bytes)
-        print(f"[DEBUG] Распознанный текст (OCR.Space) from upload: {repr(text)}")
-
-        beer_info = {}
-        if text.strip():
-            beer_info = get_beer_info(text)
-            # Update rating with user ratings (if applicable)
-            beer_info['rating'] = get_avg_rating(beer_info.get('name', ''), beer_info.get('rating', '-')) # Pass default value for get_avg_rating
-        else:
-             beer_info = {"name": "-", "description": "Не удалось распознать текст.", "rating": "-", "reviews": [], "price_quality_ratio": "-"}
-
-        # Send result back to the user in chat
-        bot = Bot(BOT_TOKEN) # Create a bot instance
-        response_text = format_beer_info(beer_info)
-        # You might want to add inline keyboard for rating here too
-        try:
-             await bot.send_message(chat_id=user_id, text=response_text, parse_mode='MarkdownV2')
-        except Exception as send_e:
-             logger.error(f"Error sending message to user {user_id}: {send_e}")
-             return json.dumps({"status": "error", "message": "Failed to send message to Telegram chat."}), 500
-
-        return json.dumps({"status": "success", "message": "Photo processed and info sent to chat."}), 200
+        return runtime.run(recognize_and_send(image_bytes, user_id))
 
     except Exception as e:
         logger.error(f"Error processing uploaded photo: {e}")
-        return json.dumps({"status": "error", "message": "Internal server error during photo processing."}), 500 
\ No newline at end of file
+        return json.dumps({"status": "error", "message": "Internal server error during photo processing."}), 500
+
+@app.errorhandler(413)
+def payload_too_large(e):
+    message = f"Photo is larger than {RECOGNIZE_MAX_BYTES // (1024 * 1024)} MB."
+    return json.dumps({"status": "error", "message": message}), 413, {'Content-Type': 'application/json'}
+
+# Распознавание для мини-приложения: multipart с полем photo, ответ — beer_info в JSON.
+# Необязательные поля: init_data (window.Telegram.WebApp.initData — пользователь для лимитов
+# и отправки в чат), send_to_chat=1 (карточка в чат)
+@app.route('/recognize', methods=['POST'])
+def recognize():
+    headers = {'Content-Type': 'application/json'}
+    file = request.files.get('photo')
+    if file is None or file.filename == '':
+        return json.dumps({"status": "error", "message": "No photo file provided."}), 400, headers
+    image_bytes = file.read()
+    if not image_bytes:
+        return json.dumps({"status": "error", "message": "Empty photo file."}), 400, headers
+
+    init_data = request.form.get('init_data')
+    user_id = webapp_user_id(init_data) if init_data else None
+    if init_data and user_id is None:
+        return json.dumps({"status": "error", "message": "Invalid Telegram init data."}), 403, headers
+    send_to_chat = request.form.get('send_to_chat', '').lower() in ('1', 'true', 'yes')
+    if send_to_chat and not user_id:
+        return json.dumps({"status": "error", "message": "init_data is required for send_to_chat."}), 400, headers
+
+    # Проверенный пользователь делит лимит с фото из чата; без initData
+    # (страница открыта не из Telegram) лимит считается по адресу клиента
+    limit_key = user_id or f'ip:{request.remote_addr}'
+    try:
+        beer_info, status, reason = runtime.run(recognize_for_client(image_bytes, limit_key))
+    except Exception as e:
+        logger.error(f"Error recognizing photo: {e}")
+        return json.dumps({"status": "error", "message": "Internal server error during photo processing."}), 500, headers
+    if beer_info is None:
+        body = {"status": "error", "message": RATE_LIMIT_MESSAGES[reason], "reason": reason}
+        return json.dumps(body, ensure_ascii=False), status, headers
+
+    if send_to_chat:
+        if WEBHOOK_MODE == 'queue':
+            # Постоянный сервер: не ждём Telegram, клиент получает ответ сразу
+            runtime.submit(send_beer_info_quietly(user_id, beer_info))
+        else:
+            # Serverless (sync по умолчанию) замораживает контейнер после ответа,
+            # и фоновая отправка потерялась бы — отправляем до ответа
+            runtime.run(send_beer_info_quietly(user_id, beer_info))
+    return json.dumps({"status": "success", "beer_info": beer_info}, ensure_ascii=False), 200, headers
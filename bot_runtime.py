@@ -0,0 +1,62 @@
+"""Долгоживущий event loop в фоновом потоке для синхронных Flask-маршрутов бота."""
+import asyncio
+import atexit
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundLoop:
+    """
+    Один event loop на процесс. Асинхронные клиенты (Bot, httpx) привязаны к
+    циклу, в котором открыли соединения, поэтому вместо нового цикла на каждый
+    запрос Flask все корутины выполняются здесь — и пулы соединений живут между
+    запросами (и между вызовами тёплого контейнера Vercel).
+    """
+
+    def __init__(self):
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._shutdown_hooks = []
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        if self._loop is None:
+            with self._lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    thread = threading.Thread(target=loop.run_forever, name='bot-loop', daemon=True)
+                    thread.start()
+                    self._loop, self._thread = loop, thread
+                    atexit.register(self.stop)
+        return self._loop
+
+    def submit(self, coro):
+        """Запускает корутину в цикле и возвращает concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout=None):
+        """Выполняет корутину в цикле и ждёт результат из вызывающего потока."""
+        return self.submit(coro).result(timeout)
+
+    def add_shutdown_hook(self, hook):
+        """Корутинная функция, которая будет выполнена в цикле при остановке."""
+        self._shutdown_hooks.append(hook)
+
+    def stop(self, timeout=10):
+        if self._loop is None:
+            return
+        loop, thread = self._loop, self._thread
+        for hook in reversed(self._shutdown_hooks):
+            try:
+                asyncio.run_coroutine_threadsafe(hook(), loop).result(timeout)
+            except Exception as e:
+                logger.error(f"Error in shutdown hook {hook.__name__}: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout)
+        self._loop = self._thread = None
+
+
+runtime = BackgroundLoop()
@@ -0,0 +1,82 @@
+"""
+Постоянно работающий бот на python-telegram-bot Application — альтернатива
+Flask-вебхуку в api/bot.py для сервера без холодных стартов.
+
+    python bot_server.py polling
+    python bot_server.py webhook   # нужен python-telegram-bot[webhooks]
+
+Update-ы проходят через ту же dispatch_update и ту же дедупликацию, что и
+Flask-вебхук, поэтому поведение обоих путей совпадает.
+"""
+import logging
+import os
+import sys
+
+from telegram import Update
+from telegram.ext import Application, TypeHandler
+from telegram.request import HTTPXRequest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api'))
+import bot  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+# Сколько update-ов Application обрабатывает одновременно
+BOT_CONCURRENT_UPDATES = int(os.getenv('BOT_CONCURRENT_UPDATES', 32))
+# Параметры режима webhook
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', os.getenv('PORT', 8443)))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '')
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+
+
+async def on_update(update: Update, context):
+    """Общая точка входа: дедупликация по update_id и маршрутизация, как во Flask-вебхуке."""
+    if bot.update_dedup.check_and_mark(f'u:{update.update_id}'):
+        logger.info(f"Duplicate update {update.update_id}, skipping")
+        return
+    await bot.dispatch_update(update, context)
+
+
+async def post_shutdown(application: Application):
+    # Bot закрывает сам Application, остаются OCR-клиенты
+    await bot.shutdown_clients()
+
+
+def build_application() -> Application:
+    application = (
+        Application.builder()
+        .token(bot.BOT_TOKEN)
+        .request(HTTPXRequest(connection_pool_size=max(bot.TELEGRAM_POOL_SIZE, BOT_CONCURRENT_UPDATES)))
+        .concurrent_updates(BOT_CONCURRENT_UPDATES)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
+    application.add_handler(TypeHandler(Update, on_update))
+    return application
+
+
+def main():
+    mode = sys.argv[1] if len(sys.argv) > 1 else 'polling'
+    application = build_application()
+    if mode == 'webhook':
+        if not WEBHOOK_URL:
+            print('WEBHOOK_URL не задан')
+            sys.exit(1)
+        application.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=WEBHOOK_URL,
+            secret_token=bot.TELEGRAM_WEBHOOK_SECRET,
+            allowed_updates=Update.ALL_TYPES,
+        )
+    elif mode == 'polling':
+        application.run_polling(allowed_updates=Update.ALL_TYPES)
+    else:
+        print('Usage: python bot_server.py [polling|webhook]')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Сборка скомпилированного каталога для быстрого холодного старта.
+
+    python build_catalog.py                 # beer_db.json -> beer_db.catalog.pickle
+    python build_catalog.py --bench         # сравнить загрузку артефакта и JSON
+    python build_catalog.py --bench --scale 100000
+
+Бот (catalog.BeerCatalog) подхватывает артефакт сам, если он собран из
+текущего beer_db.json; иначе читает JSON как раньше. После обновления
+beer_db.json артефакт нужно пересобрать.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from catalog import BEER_DB_FILE, CATALOG_ARTIFACT, artifact_path, compile_catalog, load_snapshot
+
+
+def _time_load(path, repeat):
+    """Медиана времени загрузки снимка в текущем процессе, мс."""
+    mtime = os.stat(path).st_mtime_ns
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        load_snapshot(path, mtime)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def _time_cold_start(path):
+    """Полный холодный старт в новом процессе: импорт модуля и первая загрузка, мс."""
+    code = (
+        'import time; started = time.perf_counter(); '
+        'from catalog import BeerCatalog; '
+        f'BeerCatalog({path!r}).snapshot(); '
+        'print((time.perf_counter() - started) * 1000)'
+    )
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def bench(path, scale, repeat):
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(path, encoding='utf-8') as f:
+            beers = json.load(f)
+        if scale and beers:
+            # Синтетический каталог нужного размера из копий реальных записей
+            beers = [dict(beers[i % len(beers)], name=f"{beers[i % len(beers)]['name']} #{i}") for i in range(scale)]
+        json_path = os.path.join(tmp, 'beer_db.json')
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(beers, f, ensure_ascii=False)
+
+        json_warm = _time_load(json_path, repeat)
+        json_cold = _time_cold_start(json_path)
+        started = time.perf_counter()
+        compile_catalog(json_path, os.path.join(tmp, 'beer_db.catalog.pickle'))
+        build_ms = (time.perf_counter() - started) * 1000
+        artifact_warm = _time_load(json_path, repeat)
+        artifact_cold = _time_cold_start(json_path)
+
+    print(f'Записей: {len(beers)}, сборка артефакта: {build_ms:.1f} мс')
+    print(f'{"":<12}{"загрузка":>12}{"холодный старт":>18}')
+    print(f'{"JSON":<12}{json_warm:>10.1f}мс{json_cold:>16.1f}мс')
+    print(f'{"артефакт":<12}{artifact_warm:>10.1f}мс{artifact_cold:>16.1f}мс')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Сборка скомпилированного каталога')
+    parser.add_argument('path', nargs='?', default=os.getenv('BEER_DB_FILE', BEER_DB_FILE))
+    parser.add_argument('--out', help='куда записать артефакт (по умолчанию рядом с JSON)')
+    parser.add_argument('--bench', action='store_true', help='сравнить время загрузки артефакта и JSON')
+    parser.add_argument('--scale', type=int, default=0, help='для --bench: размер синтетического каталога')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    if args.bench:
+        if CATALOG_ARTIFACT:
+            sys.exit('Для --bench уберите CATALOG_ARTIFACT: артефакт ищется рядом с временным JSON')
+        bench(args.path, args.scale, args.repeat)
+        return
+    out = compile_catalog(args.path, args.out or artifact_path(args.path))
+    print(f'Готово: {out} ({os.path.getsize(out) // 1024} КБ)')
+
+
+if __name__ == '__main__':
+    main()
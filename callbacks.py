@@ -0,0 +1,57 @@
+"""
+Компактный формат callback_data кнопок оценки.
+
+    v1:r:<id>        показать кнопки 1-10
+    v1:s:<id>:<n>    поставить оценку n
+
+<id> — короткий id товара из снимка каталога (catalog.sku_id), поэтому
+данные укладываются в лимит Telegram в 64 байта при любом названии.
+Старые кнопки rate_<название> и setrate_<название>_<n> по-прежнему
+разбираются, в том числе с '_' в названии.
+"""
+from collections import namedtuple
+
+CALLBACK_VERSION = 'v1'
+# Лимит Telegram на callback_data в байтах
+CALLBACK_MAX_BYTES = 64
+
+RATE = 'rate'
+SET_RATE = 'setrate'
+
+# beer_id — id из каталога; beer_name — только у старых кнопок
+Callback = namedtuple('Callback', 'action beer_id beer_name rating')
+
+_ACTIONS = {'r': RATE, 's': SET_RATE}
+
+
+def encode_rate(beer_id: str) -> str:
+    return f'{CALLBACK_VERSION}:r:{beer_id}'
+
+
+def encode_set_rate(beer_id: str, rating: int) -> str:
+    return f'{CALLBACK_VERSION}:s:{beer_id}:{rating}'
+
+
+def fits(data: str) -> bool:
+    return len(data.encode('utf-8')) <= CALLBACK_MAX_BYTES
+
+
+def decode(data: str):
+    """Разбирает callback_data в Callback; None, если формат не распознан."""
+    if data.startswith(f'{CALLBACK_VERSION}:'):
+        parts = data.split(':')
+        action = _ACTIONS.get(parts[1]) if len(parts) > 1 else None
+        if action == RATE and len(parts) == 3:
+            return Callback(RATE, parts[2], None, None)
+        if action == SET_RATE and len(parts) == 4 and parts[3].isdigit():
+            return Callback(SET_RATE, parts[2], None, int(parts[3]))
+        return None
+    # Кнопки, отправленные до перехода на id: название целиком в данных
+    if data.startswith('setrate_'):
+        beer_name, _, rating = data[len('setrate_'):].rpartition('_')
+        if beer_name and rating.isdigit():
+            return Callback(SET_RATE, None, beer_name, int(rating))
+        return None
+    if data.startswith('rate_'):
+        return Callback(RATE, None, data[len('rate_'):], None)
+    return None
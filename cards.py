@@ -0,0 +1,43 @@
+"""Карточка пива в MarkdownV2: статичная часть (рендерится один раз на запись каталога) и живой рейтинг."""
+
+# Спецсимволы MarkdownV2, которые нужно экранировать; таблица для str.translate
+_MARKDOWN_V2_ESCAPE = str.maketrans({c: f'\\{c}' for c in '_*[]()~`>#+-=|{}.!'})
+
+# Строки карточки: (поле, шаблон); значение подставляется уже экранированным
+_CARD_FIELDS = (
+    ('brand', '🏷 *Бренд:* {}'),
+    ('country', '🌍 *Страна:* {}'),
+    ('abv', '💪 *Крепость:* {}%'),
+    ('style', '🍻 *Сорт:* {}'),
+    ('color', '🎨 *Цвет:* {}'),
+    ('volume', '🧃 *Объем:* {} мл'),
+    ('package', '📦 *Упаковка:* {}'),
+    ('filtration', '🧊 *Фильтрация:* {}'),
+    ('imported', '🌐 *Импорт:* {}'),
+    ('flavored', '🍯 *Вкусовое:* {}'),
+)
+
+
+def escape_markdown_v2(text) -> str:
+    """Escape Telegram MarkdownV2 special characters."""
+    return str(text).translate(_MARKDOWN_V2_ESCAPE)
+
+
+def render_static(beer: dict) -> str:
+    """Всё, кроме рейтинга: название, атрибуты и описание."""
+    lines = [f"🍺 *{escape_markdown_v2(beer.get('name', '-'))}*"]
+    for key, template in _CARD_FIELDS:
+        if beer.get(key):
+            lines.append(template.format(escape_markdown_v2(beer[key])))
+    lines.append(f"\n📝 *Описание:*\n{escape_markdown_v2(beer.get('description', '-'))}")
+    return '\n'.join(lines)
+
+
+def render_rating(rating) -> str:
+    # Рейтинг вида 4.25 содержит '.', который в MarkdownV2 тоже нужно экранировать
+    return f"\n\n⭐ *Рейтинг:* {escape_markdown_v2(rating)} /10"
+
+
+def render_card(beer: dict) -> str:
+    """Полная карточка без кэша — для записей не из каталога."""
+    return render_static(beer) + render_rating(beer.get('rating', '-'))
@@ -0,0 +1,324 @@
+"""Каталог пива: однократная загрузка beer_db.json и нечёткий поиск по названиям."""
+import hashlib
+import json
+import logging
+import os
+import pickle
+import re
+import sys
+import threading
+from collections import defaultdict
+
+import numpy as np
+from rapidfuzz import fuzz, process
+
+from cards import render_static
+from catalog_feed import product_key
+
+logger = logging.getLogger(__name__)
+
+BEER_DB_FILE = 'beer_db.json'
+# Скомпилированный каталог (см. build_catalog.py); по умолчанию рядом с beer_db.json
+CATALOG_ARTIFACT = os.getenv('CATALOG_ARTIFACT', '')
+# Версия формата артефакта: при изменении структуры снимков старые файлы игнорируются
+ARTIFACT_FORMAT = 4
+# Версия вывода производных данных снимка — clean_name, sku_id (catalog_feed.product_key),
+# индекса и карточек. Поднимается при любом изменении их результата: артефакт с другой
+# версией не загружается. tests/test_catalog_artifact.py закрепляет результат за версией.
+CATALOG_DERIVATION = 2
+# Сколько кандидатов оставляет инвертированный индекс перед fuzzy-скорингом.
+# Больше — выше полнота, меньше — ниже задержка; 0 отключает префильтр.
+MAX_CANDIDATES = int(os.getenv('CATALOG_MAX_CANDIDATES', 300))
+# Вес совпадения целого слова относительно совпадения триграммы
+TOKEN_WEIGHT = 3
+
+# Слова, которые не влияют на идентификацию бренда/названия
+_WORDS_TO_REMOVE_RE = re.compile(
+    r'(пиво|напиток пивной|темное|светлое|безалкогольное|полусухой|вишневый|оригинал|premium|draught|lager|hell|blonde|blanche|pale|extra|original|fresh|rouge|nastro|azzurro|sport|port|weissbier|ipa|эль|стаут|бланш|пилзнер|американский|европейский|немецкий|бельгийский|индийский|фруктовый|красное|светлый|темный|банка|стеклянная бутылка|бутылка|фильтрованное|нефильтрованное|да|нет|импорт|вкусовое|безалкогольный|безалкогольное|мл|л)'
+)
+# Числа (объемы)
+_NUMBERS_RE = re.compile(r'\d+[.,]?\d*')
+# Лишние запятые, пробелы
+_SPACES_RE = re.compile(r'[\s,]+')
+
+
+def clean_name(name):
+    # Удаляем лишние слова и символы, которые не влияют на идентификацию бренда/названия
+    name = name.lower()
+    name = _WORDS_TO_REMOVE_RE.sub('', name)
+    name = _NUMBERS_RE.sub('', name)
+    name = _SPACES_RE.sub(' ', name)
+    return name.strip()
+
+
+def trigrams(text):
+    """Символьные триграммы строки с пробелами по краям."""
+    padded = f' {text} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def sku_id(beer) -> str:
+    """Короткий стабильный id товара: хэш catalog_feed.product_key."""
+    return hashlib.blake2b(product_key(beer).encode('utf-8'), digest_size=6).hexdigest()
+
+
+class _Postings:
+    """
+    Списки вхождений в плоском виде: ключ -> номер, все id подряд в одном
+    массиве и смещения. Пиклится как два массива и словарь, без тысяч
+    мелких numpy-объектов, поэтому загружается из артефакта почти мгновенно.
+    """
+
+    def __init__(self, lists):
+        self.slots = {key: slot for slot, key in enumerate(lists)}
+        lengths = np.fromiter((len(ids) for ids in lists.values()), dtype=np.int64, count=len(lists))
+        self.offsets = np.zeros(len(lists) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=self.offsets[1:])
+        self.ids = np.fromiter((i for ids in lists.values() for i in ids), dtype=np.int32, count=int(self.offsets[-1]))
+
+    def __contains__(self, key):
+        return key in self.slots
+
+    def __getitem__(self, key):
+        slot = self.slots[key]
+        return self.ids[self.offsets[slot]:self.offsets[slot + 1]]
+
+
+class InvertedIndex:
+    """Инвертированный индекс по словам и триграммам очищенных названий."""
+
+    def __init__(self, clean_names):
+        self.size = len(clean_names)
+        tokens = defaultdict(list)
+        grams = defaultdict(list)
+        for idx, name in enumerate(clean_names):
+            for token in set(name.split()):
+                tokens[token].append(idx)
+            for gram in trigrams(name):
+                grams[gram].append(idx)
+        self.tokens = _Postings(tokens)
+        self.grams = _Postings(grams)
+
+    def candidates(self, query, limit):
+        """Индексы записей с наибольшим числом общих слов и триграмм с запросом."""
+        postings = [self.grams[gram] for gram in trigrams(query) if gram in self.grams]
+        token_postings = [self.tokens[token] for token in set(query.split()) if token in self.tokens]
+        if not postings and not token_postings:
+            return np.empty(0, dtype=np.int32)
+        hits = np.zeros(self.size, dtype=np.int32)
+        if postings:
+            hits += np.bincount(np.concatenate(postings), minlength=self.size).astype(np.int32)
+        if token_postings:
+            hits += TOKEN_WEIGHT * np.bincount(np.concatenate(token_postings), minlength=self.size).astype(np.int32)
+        found = np.flatnonzero(hits)
+        if len(found) > limit:
+            found = found[np.argpartition(-hits[found], limit - 1)[:limit]]
+        return found
+
+
+class _Snapshot:
+    """
+    Неизменяемый срез каталога: записи, исходные и очищенные названия, id,
+    индекс и отрендеренные карточки. Кэш карточек живёт в снимке, поэтому
+    при перезагрузке каталога сбрасывается вместе с ним.
+    """
+
+    def __init__(self, beers, mtime, digest=None):
+        self.beers = beers
+        self.mtime = mtime
+        self.digest = digest
+        self.names = [beer['name'] for beer in beers]
+        self.clean_names = [clean_name(name) for name in self.names]
+        self.ids = [sku_id(beer) for beer in beers]
+        self.positions = {beer_id: idx for idx, beer_id in enumerate(self.ids)}
+        self.name_positions = {name: idx for idx, name in enumerate(self.names)}
+        if len(self.positions) < len(set(map(product_key, beers))):
+            logger.warning(f'Коллизия коротких id: {len(beers)} записей, {len(self.positions)} id')
+        self.index = InvertedIndex(self.clean_names)
+        self.cards = [None] * len(beers)
+
+    def beer(self, beer_id):
+        """Запись каталога по короткому id или None."""
+        idx = self.positions.get(beer_id)
+        return self.beers[idx] if idx is not None else None
+
+    def id_by_name(self, name):
+        """Короткий id записи по точному названию (для старых кнопок) или None."""
+        idx = self.name_positions.get(name)
+        return self.ids[idx] if idx is not None else None
+
+    def card(self, beer_id):
+        """Статичная часть MarkdownV2-карточки записи (без рейтинга) или None для неизвестного id."""
+        idx = self.positions.get(beer_id)
+        if idx is None:
+            return None
+        card = self.cards[idx]
+        if card is None:
+            card = self.cards[idx] = render_static(self.beers[idx])
+        return card
+
+    def render_cards(self):
+        for beer_id in self.ids:
+            self.card(beer_id)
+
+
+def artifact_path(path) -> str:
+    return CATALOG_ARTIFACT or os.path.splitext(path)[0] + '.catalog.pickle'
+
+
+def compile_catalog(path=BEER_DB_FILE, out=None) -> str:
+    """
+    Собирает артефакт: снимок каталога со всем, что иначе считалось бы при
+    каждом холодном старте (очищенные названия, индекс, id, карточки). В заголовке —
+    версия вывода и хэш исходного JSON, чтобы не загрузить устаревший артефакт.
+    """
+    out = out or artifact_path(path)
+    with open(path, 'rb') as f:
+        raw = f.read()
+    snapshot = _Snapshot(json.loads(raw), None, hashlib.sha256(raw).hexdigest())
+    # Карточки рендерятся при сборке, чтобы на холодном старте не тратить на них время
+    snapshot.render_cards()
+    tmp_path = f'{out}.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump((ARTIFACT_FORMAT, CATALOG_DERIVATION, snapshot.digest), f, protocol=pickle.HIGHEST_PROTOCOL)
+        pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, out)
+    return out
+
+
+def _load_artifact(path, digest):
+    """Снимок из артефакта или None, если его нет или он собран не из этого JSON или другим кодом."""
+    try:
+        with open(artifact_path(path), 'rb') as f:
+            header = pickle.load(f)
+            if header != (ARTIFACT_FORMAT, CATALOG_DERIVATION, digest):
+                logger.warning(f'Артефакт {artifact_path(path)} устарел, читаю {path}')
+                return None
+            return pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f'Не удалось загрузить артефакт: {e}')
+        return None
+
+
+def load_snapshot(path, mtime) -> _Snapshot:
+    """Загружает снимок из скомпилированного артефакта, а если его нет — из JSON."""
+    with open(path, 'rb') as f:
+        raw = f.read()
+    digest = hashlib.sha256(raw).hexdigest()
+    snapshot = _load_artifact(path, digest)
+    if snapshot is None:
+        snapshot = _Snapshot(json.loads(raw), mtime, digest)
+    snapshot.mtime = mtime
+    return snapshot
+
+
+class BeerCatalog:
+    """
+    Каталог, общий для всего процесса. Файл читается один раз и перечитывается
+    только при изменении mtime; очищенные названия считаются при загрузке.
+    """
+
+    def __init__(self, path=BEER_DB_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._snapshot = None
+
+    def snapshot(self) -> _Snapshot:
+        mtime = os.stat(self.path).st_mtime_ns
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.mtime == mtime:
+            return snapshot
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None or snapshot.mtime != mtime:
+                snapshot = load_snapshot(self.path, mtime)
+                self._snapshot = snapshot
+        return snapshot
+
+    def match(self, lines, max_candidates=None):
+        """
+        Находит лучшее совпадение для набора строк OCR за один проход cdist.
+        Если каталог больше max_candidates, скорятся только кандидаты из
+        инвертированного индекса. Возвращает (score, beer, line) или
+        (0, None, None), если строк нет.
+        """
+        if max_candidates is None:
+            max_candidates = MAX_CANDIDATES
+        lines = [line.strip() for line in lines if line.strip()]
+        snapshot = self.snapshot()
+        if not lines or not snapshot.clean_names:
+            return 0, None, None
+        queries = [clean_name(line) for line in lines]
+        if 0 < max_candidates < len(snapshot.clean_names):
+            # Объединение кандидатов по всем строкам, по возрастанию индекса,
+            # чтобы при равных оценках побеждала та же запись, что и при полном переборе
+            ids = np.unique(np.concatenate(
+                [snapshot.index.candidates(query, max_candidates) for query in queries]
+            ))
+            if not len(ids):
+                return 0, None, None
+            choices = [snapshot.clean_names[i] for i in ids]
+        else:
+            ids = None
+            choices = snapshot.clean_names
+        scores = process.cdist(queries, choices, scorer=fuzz.token_sort_ratio)
+        # argmax по развёрнутой матрице берёт первую строку и первую запись с максимумом,
+        # как и прежний цикл с extractOne
+        line_idx, choice_idx = np.unravel_index(int(np.argmax(scores)), scores.shape)
+        best_score = float(scores[line_idx, choice_idx])
+        beer_idx = int(ids[choice_idx]) if ids is not None else int(choice_idx)
+        logger.debug(f"Fuzzy match: '{lines[line_idx]}' -> '{snapshot.names[beer_idx]}' (score={best_score})")
+        return best_score, snapshot.beers[beer_idx], lines[line_idx]
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog() -> BeerCatalog:
+    """Возвращает общий для процесса экземпляр каталога."""
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                _catalog = BeerCatalog(os.getenv('BEER_DB_FILE', BEER_DB_FILE))
+    return _catalog
+
+
+def check_index(catalog, queries, max_candidates=None):
+    """
+    Сравнивает top-1 через индекс с полным перебором.
+    Возвращает список расхождений (query, индексный результат, полный перебор).
+    """
+    mismatches = []
+    for query in queries:
+        fast_score, fast_beer, _ = catalog.match(query.splitlines(), max_candidates=max_candidates)
+        full_score, full_beer, _ = catalog.match(query.splitlines(), max_candidates=0)
+        fast_name = fast_beer['name'] if fast_beer else None
+        full_name = full_beer['name'] if full_beer else None
+        # Расхождением считаем только потерю качества: другая запись с той же
+        # оценкой — это тот же ответ для пользователя
+        if fast_name != full_name and fast_score < full_score:
+            mismatches.append((query, fast_name, full_name))
+    return mismatches
+
+
+if __name__ == '__main__':
+    # python catalog.py [файл с OCR-текстами, по одному на строку]
+    # Проверка, что префильтр по индексу даёт тот же top-1, что и полный перебор.
+    catalog = BeerCatalog(os.getenv('BEER_DB_FILE', BEER_DB_FILE))
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], encoding='utf-8') as f:
+            queries = [line.strip() for line in f if line.strip()]
+    else:
+        beers = catalog.snapshot().beers
+        queries = [beer['name'] for beer in beers] + [beer['brand'] for beer in beers if beer.get('brand')]
+    # Маленький лимит, чтобы префильтр действительно работал даже на небольшом каталоге
+    limit = int(os.getenv('CATALOG_MAX_CANDIDATES', 5))
+    mismatches = check_index(catalog, queries, max_candidates=limit)
+    for query, fast_name, full_name in mismatches:
+        print(f"MISMATCH: '{query}': индекс -> '{fast_name}', перебор -> '{full_name}'")
+    print(f'Проверено запросов: {len(queries)}, расхождений: {len(mismatches)}')
+    sys.exit(1 if mismatches else 0)
@@ -0,0 +1,140 @@
+"""Версионированная раздача каталога: хэш-версия, предсжатые тела и дельты между версиями."""
+import gzip
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+try:
+    import brotli
+except ImportError:  # brotli необязателен: без него отдаём gzip
+    brotli = None
+
+BEER_DB_FILE = 'beer_db.json'
+# Сколько прошлых версий помнить для ответов since=<версия>
+CATALOG_HISTORY = int(os.getenv('CATALOG_HISTORY', 20))
+# Кэш уже посчитанных дельт (since, version) -> тело
+CATALOG_DELTA_CACHE = 64
+
+
+def _compact(data) -> bytes:
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'), sort_keys=True).encode('utf-8')
+
+
+def url_key(link: str) -> str:
+    """Путь ссылки на товар без хоста и параметров запроса."""
+    return urlparse(link).path.rstrip('/') or link
+
+
+def product_key(beer) -> str:
+    """
+    Стабильный ключ товара: от него считаются sku_id (кнопки оценок) и
+    дельты /catalog. Явный id записи важнее url — парсер ставит его, когда
+    впервые дописывает url к старой записи, чтобы её ключ (название) не
+    сменился. Без id ключ — путь ссылки, без url — название.
+    """
+    if beer.get('id'):
+        return beer['id']
+    if beer.get('url'):
+        return url_key(beer['url'])
+    return beer['name']
+
+
+class CompressedBody:
+    """Тело ответа в исходном виде и в сжатых вариантах, посчитанных один раз."""
+
+    def __init__(self, raw: bytes):
+        self.raw = raw
+        self.gzip = gzip.compress(raw, compresslevel=9)
+        self.br = brotli.compress(raw, quality=11) if brotli is not None else None
+
+    def pick(self, accept_encoding: str):
+        """Возвращает (тело, Content-Encoding или None) по заголовку Accept-Encoding."""
+        accepted = {part.split(';')[0].strip() for part in accept_encoding.split(',')}
+        if self.br is not None and 'br' in accepted:
+            return self.br, 'br'
+        if 'gzip' in accepted:
+            return self.gzip, 'gzip'
+        return self.raw, None
+
+
+class _Version:
+    def __init__(self, beers, mtime):
+        self.mtime = mtime
+        self.records = OrderedDict((product_key(beer), beer) for beer in beers)
+        self.digests = {key: hashlib.sha1(_compact(beer)).hexdigest() for key, beer in self.records.items()}
+        raw = _compact(beers)
+        self.version = hashlib.sha256(raw).hexdigest()[:16]
+        self.body = CompressedBody(_compact({'version': self.version, 'beers': beers}))
+
+
+class CatalogFeed:
+    """
+    Раздаёт beer_db.json как версионированный ресурс. Версия — хэш
+    содержимого; файл перечитывается только при изменении mtime.
+    Прошлые версии хранятся в виде хэшей записей, чтобы отдавать дельту
+    (добавленные, изменённые и удалённые товары).
+    """
+
+    def __init__(self, path=BEER_DB_FILE, history=CATALOG_HISTORY):
+        self.path = path
+        self.history = history
+        self._lock = threading.Lock()
+        self._current = None
+        self._past = OrderedDict()
+        self._deltas = OrderedDict()
+
+    def current(self) -> _Version:
+        mtime = os.stat(self.path).st_mtime_ns
+        current = self._current
+        if current is not None and current.mtime == mtime:
+            return current
+        with self._lock:
+            current = self._current
+            if current is None or current.mtime != mtime:
+                with open(self.path, encoding='utf-8') as f:
+                    beers = json.load(f)
+                loaded = _Version(beers, mtime)
+                if current is not None and loaded.version != current.version:
+                    self._past[current.version] = current.digests
+                    while len(self._past) > self.history:
+                        self._past.popitem(last=False)
+                self._current = current = loaded
+        return current
+
+    def delta(self, since: str):
+        """
+        Тело дельты от версии since до текущей; None, если since неизвестна
+        (слишком старая или процесс перезапускался) — тогда нужен полный каталог.
+        """
+        current = self.current()
+        key = (since, current.version)
+        with self._lock:
+            cached = self._deltas.get(key)
+            if cached is not None:
+                return cached
+            old = self._past.get(since)
+        if old is None:
+            return None
+        added, changed = [], []
+        for sku, beer in current.records.items():
+            digest = old.get(sku)
+            if digest is None:
+                added.append(beer)
+            elif digest != current.digests[sku]:
+                changed.append(beer)
+        removed = [sku for sku in old if sku not in current.records]
+        body = CompressedBody(_compact({
+            'version': current.version,
+            'since': since,
+            'added': added,
+            'changed': changed,
+            'removed': removed,
+        }))
+        with self._lock:
+            self._deltas[key] = body
+            while len(self._deltas) > CATALOG_DELTA_CACHE:
+                self._deltas.popitem(last=False)
+        return body
@@ -1,126 +1,528 @@
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
+"""
+Парсер каталога пива с сайта Метро в beer_db.json.
+
+    python convert_beerdb.py                       # Chrome, ручное подтверждение возраста
+    python convert_beerdb.py --workers 4 --rate 2  # 4 вкладки-браузера, не чаще 2 страниц в секунду
+    python convert_beerdb.py --fetcher http --url http://localhost:8000/listing.html
+    python convert_beerdb.py --from-dir saved_pages/
+
+Разбор страниц вынесен в parse_listing_html / parse_product_html и работает
+на сохранённом HTML, поэтому парсер можно проверять офлайн: на локальном
+сайте-фикстуре (--fetcher http) или на каталоге сохранённых страниц (--from-dir).
+
+Обновление инкрементальное: карточки, у которых не изменился отпечаток в
+листинге, не загружаются заново; результаты вливаются в существующий
+beer_db.json по ключу товара (catalog_feed.product_key — путь ссылки, а у
+старых записей прежний ключ из поля id), описания и рейтинги сохраняются.
+Прогресс пишется в журнал <output>.journal, и после падения повторный
+запуск продолжает с того же места. --full обходит все карточки.
+"""
+import argparse
+import hashlib
 import json
+import os
+import random
+import threading
 import time
+import urllib.request
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+
+from catalog_feed import product_key, url_key
 
 # URL страницы с пивом на сайте Метро
 url = 'https://online.metro-cc.ru/category/alkogolnaya-produkciya/pivo-sidr?from=under_search'
 
-# Настройка ChromeDriver
-chrome_options = Options()
-# НЕ используем headless, чтобы пользователь мог вручную нажать кнопку
-chrome_options.add_argument('--no-sandbox')
-chrome_options.add_argument('--disable-dev-shm-usage')
-
-# Запускаем браузер в обычном режиме
-driver = webdriver.Chrome(options=chrome_options)
+# Маппинг названий атрибутов на сайте в ключи beer_db.json
+ATTRIBUTE_KEYS = {
+    'Бренд': 'brand',
+    'Страна-производитель': 'country',
+    'Вес, объем': 'volume',
+    'Крепость, %': 'abv',
+    'Сорт': 'style',
+    'Плотность, %': 'density',
+    'Цвет': 'color',
+    'Тип упаковки': 'package',
+    'Фильтрация': 'filtration',
+    'Импорт': 'imported',
+    'Вкусовое': 'flavored',
+}
 
-try:
-    driver.get(url)
-    print("Страница открыта в браузере. Пожалуйста, вручную нажмите кнопку 'Подтвердить возраст'.")
-    input("После подтверждения возраста нажмите Enter в консоли для продолжения парсинга...")
+# Карточка из листинга: отпечаток — хэш того, что видно в листинге (название, цена, ссылка)
+Product = namedtuple('Product', 'name link fingerprint')
 
-    # Ждём загрузки карточек товаров
-    WebDriverWait(driver, 20).until(
-        EC.presence_of_element_located((By.CSS_SELECTOR, '.product-card'))
-    )
-    print("Карточки товаров загружены.")
+# Элементы без закрывающего тега
+_VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'track', 'wbr'}
 
-    items = driver.find_elements(By.CSS_SELECTOR, '.product-card')
-    print(f"Найдено карточек товаров: {len(items)}")
 
-    # Список для хранения данных о пиве
-    beers = []
+class _Node:
+    def __init__(self, tag, attrs, parent):
+        self.tag = tag
+        self.attrs = dict(attrs)
+        self.classes = set((self.attrs.get('class') or '').split())
+        self.parent = parent
+        self.children = []
 
-    # Обрабатываем каждую карточку
-    for idx, item in enumerate(items):
-        try:
-            name_elem = item.find_element(By.CSS_SELECTOR, '.product-card-name__text')
-            name = name_elem.text.strip()
-            # Получаем ссылку на карточку товара
-            link_elem = name_elem.find_element(By.XPATH, '..')
-            link = link_elem.get_attribute('href')
-            if not link:
-                print(f"Пропущено: {name} (нет ссылки)")
+    def find_all(self, cls=None, tag=None):
+        """Все потомки с CSS-классом cls и/или тегом tag (в порядке документа)."""
+        found = []
+        stack = list(reversed(self.children))
+        while stack:
+            node = stack.pop()
+            if isinstance(node, str):
                 continue
-        except Exception as e:
-            print(f"Ошибка при получении ссылки для товара: {e}")
+            if (cls is None or cls in node.classes) and (tag is None or node.tag == tag):
+                found.append(node)
+            stack.extend(reversed(node.children))
+        return found
+
+    def find(self, cls=None, tag=None):
+        found = self.find_all(cls, tag)
+        return found[0] if found else None
+
+    def text(self):
+        parts = []
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, str):
+                parts.append(node)
+            else:
+                stack.extend(reversed(node.children))
+        return ' '.join(' '.join(parts).split())
+
+
+class _TreeBuilder(HTMLParser):
+    """Минимальное DOM-дерево на html.parser — без зависимостей от браузера."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.root = _Node('document', [], None)
+        self._current = self.root
+
+    def handle_starttag(self, tag, attrs):
+        node = _Node(tag, attrs, self._current)
+        self._current.children.append(node)
+        if tag not in _VOID_TAGS:
+            self._current = node
+
+    def handle_startendtag(self, tag, attrs):
+        self._current.children.append(_Node(tag, attrs, self._current))
+
+    def handle_endtag(self, tag):
+        node = self._current
+        while node is not self.root and node.tag != tag:
+            node = node.parent
+        if node is not self.root:
+            self._current = node.parent
+
+    def handle_data(self, data):
+        self._current.children.append(data)
+
+
+def parse_html(html: str) -> _Node:
+    builder = _TreeBuilder()
+    builder.feed(html)
+    builder.close()
+    return builder.root
+
+
+def _fingerprint(text: str) -> str:
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+
+
+def parse_listing_html(html: str, base_url: str = url):
+    """Список Product(название, ссылка, отпечаток) из страницы категории."""
+    products = []
+    for card in parse_html(html).find_all('product-card'):
+        name_elem = card.find('product-card-name__text')
+        if name_elem is None:
+            continue
+        name = name_elem.text()
+        # Ссылка на карточку — родитель элемента с названием
+        link = name_elem.parent.attrs.get('href') if name_elem.parent is not None else None
+        if not link:
+            print(f"Пропущено: {name} (нет ссылки)")
             continue
+        link = urljoin(base_url, link)
+        products.append(Product(name, link, _fingerprint(f'{link}\n{card.text()}')))
+    return products
 
-        # Открываем карточку товара в новой вкладке
-        driver.execute_script("window.open(arguments[0]);", link)
-        driver.switch_to.window(driver.window_handles[1])
 
-        # Ждём загрузки блока с атрибутами
-        try:
-            WebDriverWait(driver, 10).until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, '.product-attributes__list'))
-            )
-            attrs = driver.find_elements(By.CSS_SELECTOR, '.product-attributes__list-item')
-            beer_info = {'name': name}
-            for attr in attrs:
+def parse_product_html(html: str, name: str = None) -> dict:
+    """Атрибуты и описание товара со страницы карточки."""
+    root = parse_html(html)
+    if root.find('product-attributes__list') is None:
+        raise ValueError('нет блока атрибутов на странице')
+    if name is None:
+        heading = root.find('product-page-content__product-name') or root.find(tag='h1')
+        name = heading.text() if heading is not None else ''
+    beer_info = {'name': name}
+    canonical = [node for node in root.find_all(tag='link') if node.attrs.get('rel') == 'canonical']
+    if canonical and canonical[0].attrs.get('href'):
+        beer_info['url'] = canonical[0].attrs['href']
+    for attr in root.find_all('product-attributes__list-item'):
+        key_elem = attr.find('product-attributes__list-item-name-text')
+        value_elem = attr.find('product-attributes__list-item-link')
+        if key_elem is None or value_elem is None:
+            continue
+        key = ATTRIBUTE_KEYS.get(key_elem.text())
+        if key:
+            beer_info[key] = value_elem.text()
+    # Парсим описание, если оно есть; в первую очередь .product-text-description__content-text
+    desc_elem = (root.find('product-text-description__content-text')
+                 or root.find('product-about')
+                 or root.find('product-description__text'))
+    beer_info['description'] = desc_elem.text() if desc_elem is not None else ''
+    return beer_info
+
+
+class RateLimiter:
+    """Общий для всех воркеров лимит: не больше rate запросов в секунду."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class HttpFetcher:
+    """Загрузка страниц обычным HTTP — для сайта-фикстуры или страниц без JS."""
+
+    def __init__(self, timeout=20):
+        self.timeout = timeout
+
+    def fetch(self, link):
+        request = urllib.request.Request(link, headers={'User-Agent': 'Mozilla/5.0'})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            charset = response.headers.get_content_charset() or 'utf-8'
+            return response.read().decode(charset, errors='replace')
+
+    def close(self):
+        pass
+
+
+def make_chrome_driver():
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+
+    chrome_options = Options()
+    # НЕ используем headless, чтобы пользователь мог вручную нажать кнопку
+    chrome_options.add_argument('--no-sandbox')
+    chrome_options.add_argument('--disable-dev-shm-usage')
+    return webdriver.Chrome(options=chrome_options)
+
+
+class SeleniumFetcher:
+    """
+    Пул браузеров: у каждого потока-воркера свой Chrome (WebDriver не
+    потокобезопасен). Куки основного окна, где вручную подтвердили возраст,
+    копируются в каждый новый браузер.
+    """
+
+    def __init__(self, make_driver, main_driver):
+        self.make_driver = make_driver
+        self.main_driver = main_driver
+        self._local = threading.local()
+        self._drivers = []
+        self._lock = threading.Lock()
+
+    def _driver(self):
+        driver = getattr(self._local, 'driver', None)
+        if driver is None:
+            driver = self.make_driver()
+            driver.get(self.main_driver.current_url)
+            for cookie in self.main_driver.get_cookies():
                 try:
-                    key = attr.find_element(By.CSS_SELECTOR, '.product-attributes__list-item-name-text').text.strip()
-                    value = attr.find_element(By.CSS_SELECTOR, '.product-attributes__list-item-link').text.strip()
-                    # Маппинг ключей
-                    if key == 'Бренд':
-                        beer_info['brand'] = value
-                    elif key == 'Страна-производитель':
-                        beer_info['country'] = value
-                    elif key == 'Вес, объем':
-                        beer_info['volume'] = value
-                    elif key == 'Крепость, %':
-                        beer_info['abv'] = value
-                    elif key == 'Сорт':
-                        beer_info['style'] = value
-                    elif key == 'Плотность, %':
-                        beer_info['density'] = value
-                    elif key == 'Цвет':
-                        beer_info['color'] = value
-                    elif key == 'Тип упаковки':
-                        beer_info['package'] = value
-                    elif key == 'Фильтрация':
-                        beer_info['filtration'] = value
-                    elif key == 'Импорт':
-                        beer_info['imported'] = value
-                    elif key == 'Вкусовое':
-                        beer_info['flavored'] = value
-                except Exception as e:
+                    driver.add_cookie(cookie)
+                except Exception:
                     continue
-            # Парсим описание, если оно есть
+            self._local.driver = driver
+            with self._lock:
+                self._drivers.append(driver)
+        return driver
+
+    def fetch(self, link):
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.webdriver.support.ui import WebDriverWait
+
+        driver = self._driver()
+        driver.get(link)
+        # Ждём загрузки блока с атрибутами
+        WebDriverWait(driver, 10).until(
+            EC.presence_of_element_located((By.CSS_SELECTOR, '.product-attributes__list'))
+        )
+        return driver.page_source
+
+    def close(self):
+        for driver in self._drivers:
             try:
-                # В первую очередь ищем .product-text-description__content-text
-                desc_elem = driver.find_element(By.CSS_SELECTOR, '.product-text-description__content-text')
-                beer_info['description'] = desc_elem.text.strip()
+                driver.quit()
             except Exception:
-                try:
-                    desc_elem = driver.find_element(By.CSS_SELECTOR, '.product-about, .product-description__text')
-                    beer_info['description'] = desc_elem.text.strip()
-                except Exception:
-                    beer_info['description'] = ''
-            beers.append(beer_info)
+                pass
+
+
+def scrape_product(fetcher, limiter, name, link, retries=3, backoff=2.0):
+    """Загружает и разбирает одну карточку с повторами и экспоненциальной задержкой."""
+    for attempt in range(retries + 1):
+        limiter.wait()
+        try:
+            beer_info = parse_product_html(fetcher.fetch(link), name)
+            beer_info['url'] = link
+            return beer_info
         except Exception as e:
-            print(f"Ошибка при парсинге карточки {name}: {e}")
-        finally:
-            # Закрываем вкладку и возвращаемся к списку
-            driver.close()
-            driver.switch_to.window(driver.window_handles[0])
-        time.sleep(1)  # чтобы не перегружать сайт
-
-    # Добавляем поля 'description' и 'rating' (пустые) для каждого объекта пива, чтобы бот не падал с ошибкой
-    for beer in beers:
-        beer['description'] = ''
-        beer['rating'] = ''
-
-    # Сохраняем в JSON
-    with open('beer_db.json', 'w', encoding='utf-8') as f:
-        json.dump(beers, f, ensure_ascii=False, indent=2)
-
-    print(f'Готово! Сохранено {len(beers)} сортов в beer_db.json')
-
-finally:
-    # Закрываем браузер
-    driver.quit() 
\ No newline at end of file
+            if attempt == retries:
+                print(f"Ошибка при парсинге карточки {name}: {e}")
+                return None
+            delay = backoff * (2 ** attempt) * (1 + random.random())
+            print(f"Повтор {attempt + 1} для {name} через {delay:.1f} с: {e}")
+            time.sleep(delay)
+
+
+class RefreshJournal:
+    """
+    Журнал прогресса (JSONL): строка на каждую обработанную карточку.
+    Пишется сразу после разбора, поэтому после падения уже загруженные
+    карточки берутся из журнала, а не с сайта.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def load(self) -> dict:
+        """key -> {'fingerprint', 'beer'} из прошлого незавершённого запуска."""
+        entries = {}
+        if not os.path.exists(self.path):
+            return entries
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Оборванная при падении последняя строка
+                    continue
+                entries[entry['key']] = entry
+        return entries
+
+    def record(self, key, fingerprint, beer):
+        line = json.dumps({'key': key, 'fingerprint': fingerprint, 'beer': beer}, ensure_ascii=False)
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def scrape_products(fetcher, products, workers=4, rate=1.0, retries=3, journal=None):
+    """
+    Параллельно обходит карточки. Возвращает {key: (отпечаток, beer)} для
+    успешно разобранных; каждая сразу пишется в журнал, если он задан.
+    """
+    limiter = RateLimiter(rate)
+
+    def work(product):
+        beer_info = scrape_product(fetcher, limiter, product.name, product.link, retries)
+        if beer_info is not None and journal is not None:
+            journal.record(url_key(product.link), product.fingerprint, beer_info)
+        return beer_info
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(work, product) for product in products]
+        for idx, future in enumerate(futures):
+            beer_info = future.result()
+            if beer_info is not None:
+                results[url_key(products[idx].link)] = (products[idx].fingerprint, beer_info)
+            print(f"[{idx + 1}/{len(futures)}] {products[idx].name}")
+    return results
+
+
+def parse_saved_pages(directory):
+    """Разбирает каталог сохранённых страниц товаров (*.html) в {key: (отпечаток, beer)}."""
+    results = {}
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith(('.html', '.htm')):
+            continue
+        with open(os.path.join(directory, filename), encoding='utf-8') as f:
+            html = f.read()
+        try:
+            beer_info = parse_product_html(html)
+        except ValueError as e:
+            print(f"Пропущено: {filename} ({e})")
+            continue
+        if not beer_info['name']:
+            beer_info['name'] = os.path.splitext(filename)[0]
+        results[product_key(beer_info)] = (_fingerprint(html), beer_info)
+    return results
+
+
+def load_json(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_json_atomic(path, data):
+    """Пишет во временный файл рядом и подменяет им исходный: читатели не видят полузаписанный JSON."""
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def merge_beers(existing, updates):
+    """
+    Вливает свежие данные в каталог по ключу товара. Старые записи без url
+    сопоставляются по названию. Непустые описания и рейтинги, которых нет в
+    свежих данных, сохраняются; товары, пропавшие из листинга, остаются.
+    Каждая запись получает явный id — её ключ на момент первого появления
+    url, — поэтому sku_id и ключи дельт /catalog не меняются при дописывании url.
+    """
+    merged = OrderedDict((product_key(beer), dict(beer)) for beer in existing)
+    by_url = {url_key(beer['url']): key for key, beer in merged.items() if beer.get('url')}
+    by_name = {beer['name']: key for key, beer in merged.items()}
+    added = changed = 0
+    for key, beer in updates.items():
+        old_key = key if key in merged else by_url.get(key) or by_name.get(beer['name'])
+        if old_key is None:
+            record = dict(beer)
+            record['id'] = key
+            record.setdefault('description', '')
+            record.setdefault('rating', '')
+            merged[key] = record
+            added += 1
+            continue
+        record = dict(merged[old_key])
+        record.setdefault('id', old_key)
+        for field, value in beer.items():
+            if value or field not in ('description', 'rating'):
+                record[field] = value
+        if record != merged[old_key]:
+            changed += 1
+        merged[old_key] = record
+    return list(merged.values()), added, changed
+
+
+def refresh_catalog(products, output, scrape, full=False):
+    """
+    Инкрементальное обновление: карточки с неизменным отпечатком
+    пропускаются, уже записанные в журнал берутся из него, остальные
+    загружаются через scrape(список Product, журнал).
+    """
+    state_path = f'{output}.state.json'
+    journal = RefreshJournal(f'{output}.journal')
+    existing = load_json(output, [])
+    fingerprints = {} if full else load_json(state_path, {})
+    known = {product_key(beer) for beer in existing} | {beer['name'] for beer in existing}
+    known |= {url_key(beer['url']) for beer in existing if beer.get('url')}
+    done = journal.load()
+
+    results, pending, skipped = {}, [], 0
+    for product in products:
+        key = url_key(product.link)
+        entry = done.get(key)
+        if entry is not None and entry['fingerprint'] == product.fingerprint:
+            results[key] = (entry['fingerprint'], entry['beer'])
+        elif fingerprints.get(key) == product.fingerprint and (key in known or product.name in known):
+            skipped += 1
+        else:
+            pending.append(product)
+    print(f"Без изменений: {skipped}, из журнала: {len(results)}, загрузить: {len(pending)}")
+
+    results.update(scrape(pending, journal))
+    save_results(results, output, fingerprints)
+    journal.remove()
+
+
+def save_results(results, output, fingerprints=None):
+    """Вливает {key: (отпечаток, beer)} в каталог и обновляет отпечатки."""
+    state_path = f'{output}.state.json'
+    if fingerprints is None:
+        fingerprints = load_json(state_path, {})
+    beers, added, changed = merge_beers(load_json(output, []), {key: beer for key, (_, beer) in results.items()})
+    fingerprints.update({key: fingerprint for key, (fingerprint, _) in results.items()})
+    write_json_atomic(output, beers)
+    write_json_atomic(state_path, fingerprints)
+    print(f'Готово! В {output} {len(beers)} сортов: новых {added}, обновлено {changed}')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Парсер каталога пива в beer_db.json')
+    parser.add_argument('--url', default=url, help='страница категории')
+    parser.add_argument('--fetcher', choices=('selenium', 'http'), default='selenium',
+                        help='selenium — Chrome с ручным подтверждением возраста, http — обычные запросы')
+    parser.add_argument('--workers', type=int, default=4, help='сколько карточек загружать параллельно')
+    parser.add_argument('--rate', type=float, default=1.0, help='не больше стольких страниц в секунду на всех')
+    parser.add_argument('--retries', type=int, default=3, help='повторов на карточку')
+    parser.add_argument('--from-dir', help='разобрать сохранённые страницы товаров вместо обхода сайта')
+    parser.add_argument('--output', default='beer_db.json')
+    parser.add_argument('--full', action='store_true', help='загрузить все карточки, даже без изменений в листинге')
+    return parser.parse_args(argv)
+
+
+def main(argv=None, make_driver=make_chrome_driver):
+    args = parse_args(argv)
+
+    if args.from_dir:
+        save_results(parse_saved_pages(args.from_dir), args.output)
+        return
+
+    def scrape(pending, journal):
+        return scrape_products(fetcher, pending, args.workers, args.rate, args.retries, journal)
+
+    if args.fetcher == 'http':
+        fetcher = HttpFetcher()
+        products = parse_listing_html(fetcher.fetch(args.url), args.url)
+        print(f"Найдено карточек товаров: {len(products)}")
+        refresh_catalog(products, args.output, scrape, args.full)
+        return
+
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.support.ui import WebDriverWait
+
+    # Запускаем браузер в обычном режиме
+    driver = make_driver()
+    fetcher = SeleniumFetcher(make_driver, driver)
+    try:
+        driver.get(args.url)
+        print("Страница открыта в браузере. Пожалуйста, вручную нажмите кнопку 'Подтвердить возраст'.")
+        input("После подтверждения возраста нажмите Enter в консоли для продолжения парсинга...")
+
+        # Ждём загрузки карточек товаров
+        WebDriverWait(driver, 20).until(
+            EC.presence_of_element_located((By.CSS_SELECTOR, '.product-card'))
+        )
+        print("Карточки товаров загружены.")
+
+        products = parse_listing_html(driver.page_source, driver.current_url)
+        print(f"Найдено карточек товаров: {len(products)}")
+
+        refresh_catalog(products, args.output, scrape, args.full)
+    finally:
+        # Закрываем браузеры
+        fetcher.close()
+        driver.quit()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,38 @@
 import React, { useEffect, useState } from 'react';
 import './App.css';
 
+// Адрес бота (Vercel) для прямого распознавания фото через /recognize.
+// Обязателен: фронтенд и бот на разных доменах, относительный путь ведёт в никуда
+const BOT_API_URL = process.env.REACT_APP_BOT_API_URL;
+if (!BOT_API_URL) {
+  console.warn('REACT_APP_BOT_API_URL не задан: прямое распознавание фото отключено');
+}
+// API рейтингов и каталога (Render)
+const API_URL = 'https://tgbotbeerchek.onrender.com';
+const CATALOG_STORAGE_KEY = 'beerCatalog';
+
+// Ключ товара — как catalog_feed.product_key на сервере: id, путь ссылки или название
+const urlKey = link => new URL(link, 'https://example.invalid').pathname.replace(/\/+$/, '') || link;
+const skuKey = beer => beer.id || (beer.url ? urlKey(beer.url) : beer.name);
+
+// Применяет дельту каталога {added, changed, removed} к сохранённой версии
+function applyCatalogDelta(beers, delta) {
+  const removed = new Set(delta.removed);
+  const changed = new Map(delta.changed.map(beer => [skuKey(beer), beer]));
+  return beers
+    .filter(beer => !removed.has(skuKey(beer)))
+    .map(beer => changed.get(skuKey(beer)) || beer)
+    .concat(delta.added);
+}
+
+function loadCachedCatalog() {
+  try {
+    return JSON.parse(localStorage.getItem(CATALOG_STORAGE_KEY));
+  } catch (e) {
+    return null;
+  }
+}
+
 function App() {
   const [tgUser, setTgUser] = useState(null);
   const [beerDb, setBeerDb] = useState([]);
@@ -15,9 +47,18 @@ function App() {
       window.Telegram.WebApp.ready();
       setTgUser(window.Telegram.WebApp.initDataUnsafe.user);
     }
-    fetch('/beer_db.json')
-      .then(res => res.json())
-      .then(data => setBeerDb(data));
+    // Показываем сохранённый каталог сразу, затем докачиваем только изменения
+    const cached = loadCachedCatalog();
+    if (cached) setBeerDb(cached.beers);
+    fetch(`${API_URL}/catalog${cached ? `?since=${encodeURIComponent(cached.version)}` : ''}`)
+      .then(res => (res.status === 304 ? null : res.json()))
+      .then(data => {
+        if (!data) return;
+        const beers = data.beers || applyCatalogDelta(cached.beers, data);
+        localStorage.setItem(CATALOG_STORAGE_KEY, JSON.stringify({ version: data.version, beers }));
+        setBeerDb(beers);
+      })
+      .catch(() => {});
   }, []);
 
   const handleSearch = () => {
@@ -29,7 +70,7 @@ function App() {
     setRating(0);
     setAvgRating(null);
     if (found) {
-      fetch(`https://tgbotbeerchek.onrender.com/rating?beer=${encodeURIComponent(found.name)}`)
+      fetch(`${API_URL}/rating?beer=${encodeURIComponent(found.name)}`)
         .then(res => res.json())
         .then(data => setAvgRating(data.avg_rating))
         .catch(() => setAvgRating(null));
@@ -47,13 +88,39 @@ function App() {
       setMessage('Спасибо за вашу оценку!');
     }
     // Отправляем оценку в API для обновления рейтинга
-    fetch('https://tgbotbeerchek.onrender.com/rating', {
+    fetch(`${API_URL}/rating`, {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
       body: JSON.stringify({ beer: result.name, rating: value })
     }).then(() => handleSearch()); // обновить средний рейтинг
   };
 
+  const handlePhotoFile = (e) => {
+    const file = e.target.files && e.target.files[0];
+    if (!file) return;
+    const form = new FormData();
+    form.append('photo', file);
+    // Подписанные Telegram данные: по ним бот проверяет, кто отправил фото
+    if (window.Telegram && window.Telegram.WebApp && window.Telegram.WebApp.initData) {
+      form.append('init_data', window.Telegram.WebApp.initData);
+    }
+    setMessage('Распознаём фото...');
+    fetch(`${BOT_API_URL}/recognize`, { method: 'POST', body: form })
+      .then(res => res.json())
+      .then(data => {
+        if (data.status !== 'success') {
+          setMessage(data.message || 'Не удалось распознать фото');
+          return;
+        }
+        setResult(data.beer_info);
+        setAvgRating(typeof data.beer_info.rating === 'number' ? data.beer_info.rating : null);
+        setRating(0);
+        setMessage('');
+      })
+      .catch(() => setMessage('Ошибка при отправке фото'));
+    e.target.value = '';
+  };
+
   const handleProcessPhoto = () => {
     // Send a signal to the bot to indicate readiness for a photo
     if (window.Telegram && window.Telegram.WebApp) {
@@ -86,6 +153,11 @@ function App() {
         {/* Button to trigger photo processing via bot chat */}
         <button onClick={handleProcessPhoto} style={{margin: '10px'}}>Обработать фото пива</button>
 
+        {/* Direct recognition: the result comes back here instead of the chat */}
+        {BOT_API_URL && (
+          <input type="file" accept="image/*" onChange={handlePhotoFile} style={{margin: '10px'}} />
+        )}
+
         {result && (
           <div style={{marginTop: 20, background: '#222', padding: 16, borderRadius: 8}}>
             <h2>{result.name}</h2>
@@ -0,0 +1,105 @@
+"""Подготовка фото перед OCR: выбор размера в Telegram, уменьшение, поворот по EXIF, контраст, JPEG."""
+import io
+import logging
+import os
+import sys
+import time
+
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+OCR_PREPROCESS = os.getenv('OCR_PREPROCESS', '1') == '1'
+# Минимальная длинная сторона фото из Telegram, достаточная для распознавания этикетки
+OCR_MIN_SIDE = int(os.getenv('OCR_MIN_SIDE', 1200))
+# Длинная сторона после уменьшения
+OCR_MAX_SIDE = int(os.getenv('OCR_MAX_SIDE', 1600))
+OCR_GRAYSCALE = os.getenv('OCR_GRAYSCALE', '1') == '1'
+OCR_AUTOCONTRAST = os.getenv('OCR_AUTOCONTRAST', '1') == '1'
+OCR_JPEG_QUALITY = int(os.getenv('OCR_JPEG_QUALITY', 80))
+
+
+def choose_photo_size(photo_sizes, min_side=OCR_MIN_SIDE):
+    """
+    Самый маленький PhotoSize, у которого длинная сторона не меньше min_side.
+    Если такого нет — самый большой (как раньше photo[-1]).
+    """
+    sizes = sorted(photo_sizes, key=lambda size: size.width * size.height)
+    for size in sizes:
+        if max(size.width, size.height) >= min_side:
+            return size
+    return sizes[-1]
+
+
+def preprocess(image_bytes: bytes, max_side=OCR_MAX_SIDE, grayscale=OCR_GRAYSCALE,
+               autocontrast=OCR_AUTOCONTRAST, quality=OCR_JPEG_QUALITY) -> bytes:
+    """
+    Уменьшает фото до max_side по длинной стороне, применяет поворот из EXIF,
+    переводит в оттенки серого, растягивает контраст и пережимает в JPEG.
+    Если результат не меньше исходника или Pillow не справился — возвращает исходные байты.
+    """
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+        # Для JPEG draft позволяет декодировать сразу в уменьшенном масштабе
+        image.draft('L' if grayscale else 'RGB', (max_side, max_side))
+        image = ImageOps.exif_transpose(image)
+        image = image.convert('L' if grayscale else 'RGB')
+        image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+        if autocontrast:
+            image = ImageOps.autocontrast(image, cutoff=1)
+        out = io.BytesIO()
+        image.save(out, format='JPEG', quality=quality, optimize=True)
+        result = out.getvalue()
+    except Exception as e:
+        logger.warning(f"Image preprocessing failed, sending original: {e}")
+        return bytes(image_bytes)
+    if len(result) >= len(image_bytes):
+        return bytes(image_bytes)
+    return result
+
+
+if __name__ == '__main__':
+    # python image_prep.py photo1.jpg [photo2.jpg ...] [--ocr]
+    # Отчёт о размере и задержке до/после предобработки. С --ocr дополнительно
+    # меряется время ответа OCR.Space (нужен OCR_SPACE_API_KEY).
+    import asyncio
+
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    paths = [arg for arg in sys.argv[1:] if arg != '--ocr']
+    with_ocr = '--ocr' in sys.argv[1:]
+    client = None
+    if with_ocr:
+        from ocr_client import OcrSpaceClient
+        client = OcrSpaceClient(os.getenv('OCR_SPACE_API_KEY'))
+
+    async def timed_ocr(data):
+        started = time.perf_counter()
+        text = await client.recognize(data, language='eng')
+        return time.perf_counter() - started, text
+
+    async def report():
+        total_before = total_after = 0
+        for path in paths:
+            with open(path, 'rb') as f:
+                original = f.read()
+            started = time.perf_counter()
+            prepared = preprocess(original)
+            prep_ms = (time.perf_counter() - started) * 1000
+            total_before += len(original)
+            total_after += len(prepared)
+            line = f'{path}: {len(original) / 1024:.1f} KB -> {len(prepared) / 1024:.1f} KB, предобработка {prep_ms:.1f} мс'
+            if client:
+                before_s, before_text = await timed_ocr(original)
+                after_s, after_text = await timed_ocr(prepared)
+                same = 'совпадает' if before_text.strip() == after_text.strip() else 'отличается'
+                line += f', OCR {before_s:.2f} с -> {after_s:.2f} с (текст {same})'
+            print(line)
+        if paths:
+            print(f'Итого: {total_before / 1024:.1f} KB -> {total_after / 1024:.1f} KB '
+                  f'({100 * total_after / total_before:.0f}%)')
+        if client:
+            await client.aclose()
+
+    asyncio.run(report())
@@ -0,0 +1,223 @@
+"""
+Поиск для inline-режима (@bot corona): автодополнение по префиксам слов
+очищенных названий и брендов, с нечётким добором, если префиксных
+совпадений мало.
+
+    python inline_search.py --bench      # задержки на 10k и 100k синтетических SKU
+"""
+import argparse
+import bisect
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from rapidfuzz import fuzz, process
+
+from catalog import BeerCatalog, clean_name, get_catalog
+
+# Результатов на страницу inline-ответа (Telegram принимает не больше 50)
+INLINE_PAGE_SIZE = int(os.getenv('INLINE_PAGE_SIZE', 20))
+# Сколько результатов ранжировать на запрос; дальше страницы не листаются
+INLINE_MAX_RESULTS = int(os.getenv('INLINE_MAX_RESULTS', 200))
+# Сколько ранжированных запросов помнить (LRU по нормализованному запросу)
+INLINE_CACHE_SIZE = int(os.getenv('INLINE_CACHE_SIZE', 2048))
+# Нечёткий добор: сколько кандидатов брать из триграммного индекса и минимальная оценка
+INLINE_FUZZY_CANDIDATES = 300
+INLINE_FUZZY_CUTOFF = 60
+# Префиксы такой длины и короче покрывают слишком много слов, чтобы собирать
+# их на лету, — их выдача считается при построении индекса
+INLINE_SHORT_PREFIX = 2
+
+
+class InlineIndex:
+    """
+    Отсортированный словарь слов (из очищенных названий и брендов) со
+    списками записей: префикс слова — это диапазон bisect в словаре.
+    Строится по снимку каталога и пересоздаётся вместе с ним.
+    """
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        postings = {}
+        for idx, beer in enumerate(snapshot.beers):
+            words = set(snapshot.clean_names[idx].split())
+            if beer.get('brand'):
+                words.update(clean_name(beer['brand']).split())
+            for word in words:
+                postings.setdefault(word, []).append(idx)
+        self.words = sorted(postings)
+        self.postings = [np.array(postings[word], dtype=np.int32) for word in self.words]
+        # Короткие названия выше: при одинаковом совпадении они точнее
+        self.name_lengths = np.array([len(name) for name in snapshot.clean_names], dtype=np.int32)
+        prefixes = {word[:length] for word in self.words for length in range(1, INLINE_SHORT_PREFIX + 1)}
+        self._short = {prefix: self._by_length(self._prefix_matches(prefix)) for prefix in prefixes}
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _prefix_matches(self, prefix):
+        lo = bisect.bisect_left(self.words, prefix)
+        hi = bisect.bisect_left(self.words, prefix + '\uffff', lo)
+        if lo == hi:
+            return np.empty(0, dtype=np.int32)
+        return np.unique(np.concatenate(self.postings[lo:hi]))
+
+    def _by_length(self, found):
+        order = np.argsort(self.name_lengths[found], kind='stable')
+        return found[order][:INLINE_MAX_RESULTS].tolist()
+
+    def _rank(self, query):
+        """Позиции записей по убыванию релевантности: сначала все слова запроса как префиксы, потом нечётко."""
+        words = query.split()
+        if len(words) == 1 and len(words[0]) <= INLINE_SHORT_PREFIX:
+            ranked = list(self._short.get(words[0], ()))
+        else:
+            found = None
+            for word in words:
+                matches = self._prefix_matches(word)
+                found = matches if found is None else np.intersect1d(found, matches, assume_unique=True)
+                if not len(found):
+                    break
+            ranked = self._by_length(found) if len(found) else []
+        if len(ranked) < INLINE_MAX_RESULTS:
+            candidates = self.snapshot.index.candidates(query, INLINE_FUZZY_CANDIDATES)
+            seen = set(ranked)
+            candidates = [int(idx) for idx in candidates if int(idx) not in seen]
+            if candidates:
+                choices = [self.snapshot.clean_names[idx] for idx in candidates]
+                extra = process.extract(query, choices, scorer=fuzz.WRatio, score_cutoff=INLINE_FUZZY_CUTOFF,
+                                        limit=INLINE_MAX_RESULTS - len(ranked))
+                ranked.extend(candidates[pos] for _, _, pos in extra)
+        return ranked
+
+    def search(self, text, offset='', page_size=INLINE_PAGE_SIZE):
+        """
+        Возвращает (позиции записей снимка для страницы, next_offset).
+        next_offset — пустая строка, если страниц больше нет.
+        """
+        query = clean_name(text)
+        if not query:
+            return [], ''
+        with self._lock:
+            ranked = self._cache.get(query)
+            if ranked is not None:
+                self._cache.move_to_end(query)
+                self.hits += 1
+        if ranked is None:
+            ranked = self._rank(query)
+            with self._lock:
+                self.misses += 1
+                self._cache[query] = ranked
+                while len(self._cache) > INLINE_CACHE_SIZE:
+                    self._cache.popitem(last=False)
+        start = int(offset) if offset and offset.isdigit() else 0
+        page = ranked[start:start + page_size]
+        next_offset = str(start + page_size) if start + page_size < len(ranked) else ''
+        return page, next_offset
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'entries': len(self._cache), 'hits': self.hits, 'misses': self.misses,
+                    'words': len(self.words)}
+
+
+_inline_index = None
+_inline_lock = threading.Lock()
+
+
+def get_inline_index() -> InlineIndex:
+    """Индекс по текущему снимку каталога; при перезагрузке каталога строится заново."""
+    global _inline_index
+    snapshot = get_catalog().snapshot()
+    index = _inline_index
+    if index is None or index.snapshot is not snapshot:
+        with _inline_lock:
+            index = _inline_index
+            if index is None or index.snapshot is not snapshot:
+                index = _inline_index = InlineIndex(snapshot)
+    return index
+
+
+def _percentiles(timings):
+    timings = sorted(timings)
+    return statistics.median(timings), timings[int(len(timings) * 0.95) - 1], timings[-1]
+
+
+def _synthetic_word(i):
+    """Уникальное «слово» из букв для синтетического SKU (clean_name убирает цифры)."""
+    letters = 'бвгдклмнпрстaeiou'
+    word = ''
+    while True:
+        i, rest = divmod(i, len(letters))
+        word += letters[rest]
+        if not i:
+            return f'x{word}'
+
+
+def bench(path, sizes, queries_count):
+    with open(path, encoding='utf-8') as f:
+        beers = json.load(f)
+    rng = np.random.default_rng(0)
+    for size in sizes:
+        # Синтетический каталог из реальных записей с уникальным словом в названии
+        synthetic = [dict(beers[i % len(beers)], name=f"{beers[i % len(beers)]['name']} {_synthetic_word(i)}")
+                     for i in range(size)]
+        with tempfile.TemporaryDirectory() as tmp:
+            json_path = os.path.join(tmp, 'beer_db.json')
+            with open(json_path, 'w', encoding='utf-8') as f:
+                json.dump(synthetic, f, ensure_ascii=False)
+            snapshot = BeerCatalog(json_path).snapshot()
+        started = time.perf_counter()
+        index = InlineIndex(snapshot)
+        build_ms = (time.perf_counter() - started) * 1000
+
+        # Запросы как при наборе: префиксы слов названий и брендов разной длины плюс опечатки
+        queries = []
+        for idx in rng.integers(0, size, queries_count):
+            words = snapshot.clean_names[idx].split() or ['x']
+            word = words[int(rng.integers(0, len(words)))]
+            query = word[:int(rng.integers(1, len(word) + 1))]
+            if rng.random() < 0.2 and len(query) > 3:
+                query = query[:-2] + query[-1]
+            queries.append(query)
+
+        def measure(cached):
+            timings = []
+            for query in queries:
+                if not cached:
+                    index._cache.clear()
+                started = time.perf_counter()
+                index.search(query)
+                timings.append((time.perf_counter() - started) * 1000)
+            return _percentiles(timings)
+
+        cold = measure(cached=False)
+        for query in queries:
+            index.search(query)
+        warm = measure(cached=True)
+        print(f'SKU: {size}, индекс: {build_ms:.0f} мс, слов: {len(index.words)}')
+        print(f'  без кэша: p50 {cold[0]:.2f} мс, p95 {cold[1]:.2f} мс, max {cold[2]:.2f} мс')
+        print(f'  из кэша:  p50 {warm[0]:.3f} мс, p95 {warm[1]:.3f} мс, max {warm[2]:.3f} мс')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Inline-поиск по каталогу')
+    parser.add_argument('query', nargs='?')
+    parser.add_argument('--bench', action='store_true', help='задержки на 10k и 100k синтетических SKU')
+    parser.add_argument('--sizes', default='10000,100000')
+    parser.add_argument('--queries', type=int, default=500)
+    args = parser.parse_args()
+    if args.bench:
+        bench(os.getenv('BEER_DB_FILE', 'beer_db.json'), [int(size) for size in args.sizes.split(',')], args.queries)
+    elif args.query:
+        index = get_inline_index()
+        page, next_offset = index.search(args.query)
+        for idx in page:
+            print(index.snapshot.names[idx])
+        print(f'next_offset={next_offset!r}')
@@ -0,0 +1,151 @@
+"""
+Топ пив по байесовскому рейтингу, поддерживаемый инкрементально.
+
+Оценка пива: (C * m + сумма) / (C + количество), где m — рейтинг из
+каталога (если он числовой) или средняя оценка по всем пивам, а C —
+вес априорного значения в «голосах». Пива с числом оценок меньше
+минимума в топ не попадают, как и названия не из каталога: оценку можно
+поставить по сырому тексту OCR (старые кнопки setrate_) или POST-ом в api.py.
+"""
+import bisect
+import os
+import threading
+import time
+
+from ratings_store import RATING_MAX, RATING_MIN
+
+LEADERBOARD_MIN_VOTES = int(os.getenv('LEADERBOARD_MIN_VOTES', 3))
+LEADERBOARD_PRIOR_WEIGHT = float(os.getenv('LEADERBOARD_PRIOR_WEIGHT', 5))
+# Раз в сколько секунд перечитывать суммы из хранилища: оценки пишут и другие процессы
+LEADERBOARD_REFRESH = float(os.getenv('LEADERBOARD_REFRESH', 60))
+# На сколько может уйти общее среднее, прежде чем пересчитать оценки всех пив
+LEADERBOARD_MEAN_TOLERANCE = float(os.getenv('LEADERBOARD_MEAN_TOLERANCE', 0.1))
+# Максимальный размер топа в одном запросе
+LEADERBOARD_MAX_LIMIT = 100
+
+
+def numeric_rating(value):
+    """Рейтинг каталога числом или None ('' и '-' в каталоге означают «нет рейтинга»)."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(str(value).replace(',', '.'))
+    except ValueError:
+        return None
+
+
+class Leaderboard:
+    """
+    Суммы и количество оценок по каждому пиву плюс отсортированный по
+    убыванию оценки список допущенных пив. Новая оценка переставляет одно
+    пиво (bisect), запрос топа — срез списка, то есть O(N) от размера ответа.
+    Полный пересчёт идёт только при уходе общего среднего и раз в
+    LEADERBOARD_REFRESH секунд (тогда суммы перечитываются из хранилища).
+    """
+
+    def __init__(self, store, base_ratings=dict, min_votes=LEADERBOARD_MIN_VOTES,
+                 prior_weight=LEADERBOARD_PRIOR_WEIGHT, refresh=LEADERBOARD_REFRESH):
+        self.store = store
+        # Функция без аргументов: {название: рейтинг из каталога}
+        self.base_ratings = base_ratings
+        self.min_votes = min_votes
+        self.prior_weight = prior_weight
+        self.refresh = refresh
+        self._lock = threading.Lock()
+        self._totals = {}
+        # Названия из каталога: только они попадают в топ и в общее среднее
+        self._names = frozenset()
+        self._bases = {}
+        self._scores = {}
+        self._ranked = []
+        self._sum = 0
+        self._count = 0
+        self._mean = None
+        self._loaded_at = None
+
+    def _score(self, name, total, count):
+        prior = self._bases.get(name)
+        if prior is None:
+            prior = self._mean
+        return (self.prior_weight * prior + total) / (self.prior_weight + count)
+
+    def _rescore(self):
+        """Пересчитывает оценки всех пив по текущим суммам и общему среднему."""
+        self._mean = self._sum / self._count if self._count else 0.0
+        self._scores = {
+            name: self._score(name, total, count)
+            for name, (total, count) in self._totals.items() if count >= self.min_votes
+        }
+        self._ranked = sorted((-score, name) for name, score in self._scores.items())
+
+    def _load(self):
+        base_ratings = self.base_ratings()
+        self._names = frozenset(base_ratings)
+        # Среднее вне шкалы возможно только из-за оценок, сохранённых до проверки диапазона
+        self._totals = {
+            name: (total, count) for name, (total, count) in self.store.all_totals().items()
+            if name in self._names and count and RATING_MIN <= total / count <= RATING_MAX
+        }
+        self._bases = {}
+        for name, value in base_ratings.items():
+            base = numeric_rating(value)
+            if base is not None:
+                self._bases[name] = base
+        self._sum = sum(total for total, _ in self._totals.values())
+        self._count = sum(count for _, count in self._totals.values())
+        self._rescore()
+        self._loaded_at = time.monotonic()
+
+    def _reposition(self, name):
+        old = self._scores.pop(name, None)
+        if old is not None:
+            del self._ranked[bisect.bisect_left(self._ranked, (-old, name))]
+        total, count = self._totals[name]
+        if count >= self.min_votes:
+            score = self._score(name, total, count)
+            self._scores[name] = score
+            bisect.insort(self._ranked, (-score, name))
+
+    def record(self, votes):
+        """Учитывает сохранённые оценки [(название, оценка), ...]; до первого запроса топа ничего не делает."""
+        with self._lock:
+            if self._loaded_at is None:
+                # Топ ещё не строился — при построении суммы прочитаются из хранилища
+                return
+            votes = [(name, rating) for name, rating in votes
+                     if name in self._names and RATING_MIN <= rating <= RATING_MAX]
+            if not votes:
+                return
+            for name, rating in votes:
+                total, count = self._totals.get(name, (0, 0))
+                self._totals[name] = (total + rating, count + 1)
+                self._sum += rating
+                self._count += 1
+            mean = self._sum / self._count
+            if abs(mean - self._mean) > LEADERBOARD_MEAN_TOLERANCE:
+                self._rescore()
+            else:
+                for name in {name for name, _ in votes}:
+                    self._reposition(name)
+
+    def top(self, limit=10):
+        """[{'beer', 'score', 'avg_rating', 'votes'}, ...] по убыванию байесовской оценки."""
+        limit = max(0, min(limit, LEADERBOARD_MAX_LIMIT))
+        with self._lock:
+            if self._loaded_at is None or time.monotonic() - self._loaded_at > self.refresh:
+                self._load()
+            result = []
+            for neg_score, name in self._ranked[:limit]:
+                total, count = self._totals[name]
+                result.append({
+                    'beer': name,
+                    'score': round(-neg_score, 2),
+                    'avg_rating': round(total / count, 2),
+                    'votes': count,
+                })
+            return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'beers': len(self._totals), 'ranked': len(self._ranked), 'votes': self._count,
+                    'mean': round(self._mean, 3) if self._mean is not None else None}
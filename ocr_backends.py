@@ -0,0 +1,210 @@
+"""Подключаемые OCR-движки: удалённый OCR.Space, локальный Tesseract и политика маршрутизации."""
+import asyncio
+import io
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# remote — только OCR.Space, local — только Tesseract,
+# local_first — сначала Tesseract, при низкой уверенности OCR.Space
+OCR_BACKEND = os.getenv('OCR_BACKEND', 'remote')
+TESSERACT_LANG = os.getenv('TESSERACT_LANG', 'rus+eng')
+TESSERACT_WORKERS = int(os.getenv('TESSERACT_WORKERS', os.cpu_count() or 1))
+# Средняя уверенность Tesseract (0-100), ниже которой в режиме local_first идём в OCR.Space
+OCR_MIN_CONFIDENCE = float(os.getenv('OCR_MIN_CONFIDENCE', 60))
+# Языки, на которых одно фото одновременно отправляется в OCR.Space, например rus,eng,auto.
+# Один язык — обычный запрос без параллельного веера.
+OCR_LANGUAGES = [lang.strip() for lang in os.getenv('OCR_LANGUAGES', 'eng').split(',') if lang.strip()]
+# Оценка совпадения с каталогом (0-100), при которой ответ принимается сразу, а остальные запросы отменяются
+OCR_FANOUT_THRESHOLD = float(os.getenv('OCR_FANOUT_THRESHOLD', 70))
+
+
+class OcrResult:
+    """Распознанный текст, уверенность движка (None, если он её не сообщает) и имя движка."""
+
+    def __init__(self, text, confidence=None, engine=''):
+        self.text = text
+        self.confidence = confidence
+        self.engine = engine
+
+    def __repr__(self):
+        return f'OcrResult(engine={self.engine!r}, confidence={self.confidence!r}, text={self.text!r})'
+
+
+class OcrBackend:
+    """Интерфейс OCR-движка."""
+
+    name = ''
+
+    async def recognize(self, image_bytes: bytes, language: str = 'eng') -> OcrResult:
+        raise NotImplementedError
+
+    async def aclose(self):
+        pass
+
+
+class RemoteOcrBackend(OcrBackend):
+    """OCR.Space через общий асинхронный клиент."""
+
+    name = 'ocr_space'
+
+    def __init__(self, client):
+        self.client = client
+
+    async def recognize(self, image_bytes: bytes, language: str = 'eng') -> OcrResult:
+        text = await self.client.recognize(image_bytes, language=language)
+        return OcrResult(text, engine=self.name)
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+def _tesseract_recognize(image_bytes: bytes, lang: str):
+    """Выполняется в дочернем процессе: возвращает (текст, средняя уверенность по словам)."""
+    import pytesseract
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(image_bytes))
+    data = pytesseract.image_to_data(image, lang=lang, output_type=pytesseract.Output.DICT)
+    lines = {}
+    confidences = []
+    for i, word in enumerate(data['text']):
+        conf = float(data['conf'][i])
+        if not word.strip() or conf < 0:
+            continue
+        confidences.append(conf)
+        key = (data['block_num'][i], data['par_num'][i], data['line_num'][i])
+        lines.setdefault(key, []).append(word)
+    text = '\n'.join(' '.join(words) for _, words in sorted(lines.items()))
+    confidence = sum(confidences) / len(confidences) if confidences else 0.0
+    return text, confidence
+
+
+class TesseractOcrBackend(OcrBackend):
+    """
+    Локальный Tesseract в пуле процессов по числу ядер. Распознаёт сразу
+    все языки из TESSERACT_LANG, поэтому язык запроса игнорируется.
+    Процессы пула запускаются через forkserver (spawn, где его нет), а не
+    fork: пул создаётся из потока фонового цикла в процессе с потоками
+    Flask/gunicorn, и fork унёс бы в дочерний процесс чужие захваченные
+    блокировки — такой воркер может зависнуть навсегда.
+    """
+
+    name = 'tesseract'
+
+    def __init__(self, lang=TESSERACT_LANG, workers=TESSERACT_WORKERS):
+        self.lang = lang
+        self.workers = workers
+        self._executor = None
+
+    def _get_executor(self):
+        # Пул создаётся лениво: на serverless без локального OCR он не нужен
+        if self._executor is None:
+            method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context(method))
+        return self._executor
+
+    async def recognize(self, image_bytes: bytes, language: str = 'eng') -> OcrResult:
+        loop = asyncio.get_running_loop()
+        text, confidence = await loop.run_in_executor(
+            self._get_executor(), _tesseract_recognize, bytes(image_bytes), self.lang
+        )
+        return OcrResult(text, confidence, engine=self.name)
+
+    async def aclose(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+class FanOutOcrBackend(OcrBackend):
+    """
+    Отправляет фото в несколько языков сразу. Каждый ответ по мере прихода
+    оценивается scorer(text) (совпадение с каталогом); первый, набравший
+    threshold, побеждает, остальные запросы отменяются. Если порог никто
+    не набрал — возвращается лучший по оценке.
+    """
+
+    name = 'fanout'
+
+    def __init__(self, backend, scorer, languages=None, threshold=OCR_FANOUT_THRESHOLD):
+        self.backend = backend
+        self.scorer = scorer
+        self.languages = languages or OCR_LANGUAGES
+        self.threshold = threshold
+
+    async def _recognize_one(self, image_bytes, language):
+        result = await self.backend.recognize(image_bytes, language)
+        result.engine = f'{result.engine}:{language}'
+        return result
+
+    async def recognize(self, image_bytes: bytes, language: str = 'eng') -> OcrResult:
+        if len(self.languages) == 1:
+            return await self._recognize_one(image_bytes, self.languages[0])
+        pending = {asyncio.create_task(self._recognize_one(image_bytes, lang)) for lang in self.languages}
+        best, best_score, error = None, -1.0, None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        error = e
+                        continue
+                    score = self.scorer(result.text) if result.text.strip() else 0.0
+                    logger.info(f"OCR {result.engine}: catalog score {score:.1f}")
+                    if score > best_score:
+                        best, best_score = result, score
+                if best_score >= self.threshold:
+                    break
+        finally:
+            for task in pending:
+                task.cancel()
+        if best is None:
+            raise error
+        return best
+
+    async def aclose(self):
+        await self.backend.aclose()
+
+
+class RoutingOcrBackend(OcrBackend):
+    """Выбор движка по политике remote / local / local_first."""
+
+    name = 'routing'
+
+    def __init__(self, local, remote, policy=OCR_BACKEND, min_confidence=OCR_MIN_CONFIDENCE):
+        if policy not in ('remote', 'local', 'local_first'):
+            raise ValueError(f'Unknown OCR backend policy: {policy}')
+        self.local = local
+        self.remote = remote
+        self.policy = policy
+        self.min_confidence = min_confidence
+
+    async def recognize(self, image_bytes: bytes, language: str = 'eng') -> OcrResult:
+        if self.policy == 'remote':
+            return await self.remote.recognize(image_bytes, language)
+        if self.policy == 'local':
+            return await self.local.recognize(image_bytes, language)
+        try:
+            local_result = await self.local.recognize(image_bytes, language)
+        except Exception as e:
+            logger.warning(f"Local OCR failed, falling back to remote: {e}")
+            return await self.remote.recognize(image_bytes, language)
+        if local_result.text.strip() and local_result.confidence >= self.min_confidence:
+            return local_result
+        logger.info(f"Local OCR confidence {local_result.confidence:.1f} is low, trying remote")
+        try:
+            return await self.remote.recognize(image_bytes, language)
+        except Exception as e:
+            logger.warning(f"Remote OCR failed, using local result: {e}")
+            return local_result
+
+    async def aclose(self):
+        await self.local.aclose()
+        await self.remote.aclose()
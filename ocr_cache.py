@@ -0,0 +1,152 @@
+"""Кэш результатов OCR по перцептивному хэшу изображения (dHash)."""
+import io
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+OCR_CACHE_SIZE = int(os.getenv('OCR_CACHE_SIZE', 512))
+OCR_CACHE_TTL = float(os.getenv('OCR_CACHE_TTL', 7 * 24 * 3600))
+# Максимальное расстояние Хэмминга между хэшами, при котором фото считаются одинаковыми
+OCR_CACHE_DISTANCE = int(os.getenv('OCR_CACHE_DISTANCE', 4))
+# Файл дискового уровня кэша (JSON Lines); пусто — только память
+OCR_CACHE_FILE = os.getenv('OCR_CACHE_FILE', '')
+
+
+def _record(language, value, text, stored_at):
+    return json.dumps([language, f'{value:016x}', text, stored_at], ensure_ascii=False) + '\n'
+
+
+def image_hash(image_bytes: bytes) -> int:
+    """64-битный dHash: знаки разностей соседних пикселей уменьшенного серого изображения."""
+    image = Image.open(io.BytesIO(image_bytes))
+    # Для JPEG draft декодирует сразу в уменьшенном масштабе — заметно быстрее полного декодирования
+    image.draft('L', (64, 64))
+    pixels = list(image.convert('L').resize((9, 8), Image.Resampling.LANCZOS).getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+class OcrCache:
+    """
+    LRU-кэш с TTL: (язык, хэш) -> распознанный текст. Совпадением считается
+    запись с расстоянием Хэмминга не больше threshold. Необязательный дисковый
+    уровень (JSON Lines) переживает перезапуски.
+    """
+
+    def __init__(self, max_entries=OCR_CACHE_SIZE, ttl=OCR_CACHE_TTL,
+                 threshold=OCR_CACHE_DISTANCE, path=OCR_CACHE_FILE):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self.path = path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._appended = 0
+        if self.path:
+            self._load()
+
+    def _expired(self, stored_at, now):
+        return self.ttl > 0 and now - stored_at > self.ttl
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        now = time.time()
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    language, hash_hex, text, stored_at = json.loads(line)
+                except ValueError:
+                    continue
+                if self._expired(stored_at, now):
+                    continue
+                key = (language, int(hash_hex, 16))
+                self._entries.pop(key, None)
+                self._entries[key] = (text, stored_at)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        # Сжимаем файл до актуального содержимого
+        self._rewrite()
+        logger.info(f"OCR cache loaded {len(self._entries)} entries from {self.path}")
+
+    def _rewrite(self):
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for (language, value), (text, stored_at) in self._entries.items():
+                f.write(_record(language, value, text, stored_at))
+        os.replace(tmp_path, self.path)
+
+    def get(self, value: int, language: str):
+        """Возвращает текст для близкого изображения или None."""
+        now = time.time()
+        with self._lock:
+            key = (language, value)
+            entry = self._entries.get(key)
+            if entry is None and self.threshold > 0:
+                for (cached_language, cached_value), cached in self._entries.items():
+                    if cached_language == language and (cached_value ^ value).bit_count() <= self.threshold:
+                        key, entry = (cached_language, cached_value), cached
+                        break
+            if entry is None:
+                self.misses += 1
+                return None
+            text, stored_at = entry
+            if self._expired(stored_at, now):
+                del self._entries[key]
+                self.evictions += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            if key[1] == value:
+                self.hits += 1
+            else:
+                self.near_hits += 1
+            return text
+
+    def put(self, value: int, language: str, text: str):
+        stored_at = time.time()
+        with self._lock:
+            key = (language, value)
+            self._entries.pop(key, None)
+            self._entries[key] = (text, stored_at)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            if self.path:
+                self._appended += 1
+                if self._appended > self.max_entries:
+                    # Файл разросся вытесненными записями — переписываем целиком
+                    self._rewrite()
+                    self._appended = 0
+                else:
+                    with open(self.path, 'a', encoding='utf-8') as f:
+                        f.write(_record(language, value, text, stored_at))
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.near_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'near_hits': self.near_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round((self.hits + self.near_hits) / lookups, 4) if lookups else None,
+            }
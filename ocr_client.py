@@ -0,0 +1,107 @@
+"""Асинхронный клиент OCR.Space: общий пул соединений, таймауты, повторы, лимит параллельности."""
+import asyncio
+import logging
+import os
+import random
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# URL можно переопределить, например, на локальный фейковый сервер OCR.Space
+OCR_SPACE_URL = os.getenv('OCR_SPACE_URL', 'https://api.ocr.space/parse/image')
+OCR_CONNECT_TIMEOUT = float(os.getenv('OCR_CONNECT_TIMEOUT', 5))
+OCR_READ_TIMEOUT = float(os.getenv('OCR_READ_TIMEOUT', 30))
+OCR_RETRIES = int(os.getenv('OCR_RETRIES', 2))
+OCR_BACKOFF = float(os.getenv('OCR_BACKOFF', 0.5))
+OCR_MAX_CONCURRENCY = int(os.getenv('OCR_MAX_CONCURRENCY', 8))
+
+# Коды ответа, при которых имеет смысл повторить запрос
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class OcrError(Exception):
+    """OCR.Space не ответил после всех попыток."""
+
+
+class _LoopState:
+    """HTTP-клиент и семафор, привязанные к одному event loop."""
+
+    def __init__(self, loop, max_concurrency, timeout):
+        self.loop = loop
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.client = httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency),
+        )
+
+
+class OcrSpaceClient:
+    """
+    Клиент OCR.Space с одним пулом соединений на event loop.
+    httpx.AsyncClient и asyncio.Semaphore нельзя переносить между циклами,
+    поэтому при смене цикла (например, новый цикл на каждый запрос Flask)
+    создаётся новое состояние; в долгоживущем цикле пул переиспользуется.
+    """
+
+    def __init__(self, api_key, url=OCR_SPACE_URL, connect_timeout=OCR_CONNECT_TIMEOUT,
+                 read_timeout=OCR_READ_TIMEOUT, retries=OCR_RETRIES, backoff=OCR_BACKOFF,
+                 max_concurrency=OCR_MAX_CONCURRENCY):
+        self.api_key = api_key
+        self.url = url
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_concurrency = max_concurrency
+        self._state = None
+
+    def _get_state(self) -> _LoopState:
+        loop = asyncio.get_running_loop()
+        state = self._state
+        if state is None or state.loop is not loop or state.client.is_closed:
+            state = _LoopState(loop, self.max_concurrency, self.timeout)
+            self._state = state
+        return state
+
+    async def _post(self, state, data, image_bytes):
+        files = {'file': ('image.jpg', bytes(image_bytes), 'image/jpeg')}
+        for attempt in range(self.retries + 1):
+            try:
+                response = await state.client.post(self.url, data=data, files=files)
+                if response.status_code not in RETRY_STATUSES:
+                    response.raise_for_status()
+                    return response.json()
+                error = OcrError(f'OCR.Space HTTP {response.status_code}')
+            except (httpx.TransportError, httpx.TimeoutException) as e:
+                error = e
+            if attempt < self.retries:
+                delay = self.backoff * (2 ** attempt) * (1 + random.random())
+                logger.warning(f"OCR.Space attempt {attempt + 1} failed ({error!r}), retry in {delay:.2f}s")
+                await asyncio.sleep(delay)
+        raise OcrError(f'OCR.Space failed after {self.retries + 1} attempts: {error!r}')
+
+    async def recognize(self, image_bytes: bytes, language: str = 'eng') -> str:
+        """Отправляет изображение в OCR.Space и возвращает распознанный текст."""
+        data = {
+            'apikey': self.api_key,
+            'language': language,
+            'isOverlayRequired': 'false',
+        }
+        if language == 'auto':
+            # Автоопределение языка есть только у второго движка OCR.Space
+            data['OCREngine'] = '2'
+        state = self._get_state()
+        async with state.semaphore:
+            result = await self._post(state, data, image_bytes)
+        if result.get('IsErroredOnProcessing'):
+            return ''
+        parsed_results = result.get('ParsedResults')
+        if parsed_results and len(parsed_results) > 0:
+            return parsed_results[0].get('ParsedText', '')
+        return ''
+
+    async def aclose(self):
+        state = self._state
+        self._state = None
+        if state is not None and not state.client.is_closed:
+            await state.client.aclose()
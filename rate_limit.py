@@ -0,0 +1,140 @@
+"""Ограничение частоты распознавания: token bucket на пользователя и общий на процесс."""
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+
+RATE_USER_PER_MINUTE = float(os.getenv('RATE_USER_PER_MINUTE', 6))
+RATE_USER_BURST = float(os.getenv('RATE_USER_BURST', 3))
+RATE_GLOBAL_PER_MINUTE = float(os.getenv('RATE_GLOBAL_PER_MINUTE', 60))
+RATE_GLOBAL_BURST = float(os.getenv('RATE_GLOBAL_BURST', 10))
+# Сколько секунд запрос может ждать своей очереди; дольше — отказ
+RATE_MAX_WAIT = float(os.getenv('RATE_MAX_WAIT', 10))
+# Сколько запросов одного пользователя могут одновременно ждать в очереди
+RATE_MAX_PENDING_PER_USER = int(os.getenv('RATE_MAX_PENDING_PER_USER', 1))
+# Сколько пользовательских корзин держать в памяти
+RATE_MAX_USERS = int(os.getenv('RATE_MAX_USERS', 10000))
+
+# Причины отказа
+REJECT_USER = 'user'
+REJECT_GLOBAL = 'global'
+
+
+class TokenBucket:
+    """
+    Корзина с резервированием: токены могут уходить в минус, и тогда
+    запрос ждёт, пока корзина восполнится. Запросы обслуживаются в порядке
+    резервирования, так что очередь справедлива (FIFO).
+    """
+
+    def __init__(self, per_minute, burst):
+        self.rate = per_minute / 60.0
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now) -> float:
+        """Через сколько секунд появится токен для нового запроса."""
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else float('inf')
+
+    def reserve(self):
+        self.tokens -= 1
+
+
+class RecognitionLimiter:
+    """Пользовательские корзины + общая корзина перед конвейером распознавания."""
+
+    def __init__(self, user_per_minute=RATE_USER_PER_MINUTE, user_burst=RATE_USER_BURST,
+                 global_per_minute=RATE_GLOBAL_PER_MINUTE, global_burst=RATE_GLOBAL_BURST,
+                 max_wait=RATE_MAX_WAIT, max_pending_per_user=RATE_MAX_PENDING_PER_USER,
+                 max_users=RATE_MAX_USERS):
+        self.user_per_minute = user_per_minute
+        self.user_burst = user_burst
+        self.max_wait = max_wait
+        self.max_pending_per_user = max_pending_per_user
+        self.max_users = max_users
+        self._global = TokenBucket(global_per_minute, global_burst)
+        self._users = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.queued = 0
+        self.rejected_user = 0
+        self.rejected_global = 0
+        self.wait_seconds = 0.0
+
+    def _user_bucket(self, user_id):
+        bucket = self._users.get(user_id)
+        if bucket is None:
+            bucket = TokenBucket(self.user_per_minute, self.user_burst)
+            self._users[user_id] = bucket
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        else:
+            self._users.move_to_end(user_id)
+        return bucket
+
+    def _reserve(self, user_id):
+        """Резервирует токены в обеих корзинах; возвращает (ожидание, причина отказа)."""
+        now = time.monotonic()
+        with self._lock:
+            user_bucket = self._user_bucket(user_id)
+            user_wait = user_bucket.wait_time(now)
+            global_wait = self._global.wait_time(now)
+            wait = max(user_wait, global_wait)
+            if user_wait > self.max_wait or (wait > 0 and self._pending.get(user_id, 0) >= self.max_pending_per_user):
+                self.rejected_user += 1
+                return None, REJECT_USER
+            if global_wait > self.max_wait:
+                self.rejected_global += 1
+                return None, REJECT_GLOBAL
+            user_bucket.reserve()
+            self._global.reserve()
+            self.allowed += 1
+            if wait > 0:
+                self.queued += 1
+                self.wait_seconds += wait
+                self._pending[user_id] = self._pending.get(user_id, 0) + 1
+            return wait, None
+
+    async def acquire(self, user_id):
+        """
+        Ждёт своей очереди и возвращает None, либо сразу возвращает причину
+        отказа (REJECT_USER / REJECT_GLOBAL), если ждать пришлось бы дольше max_wait.
+        """
+        wait, reason = self._reserve(user_id)
+        if reason:
+            return reason
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                with self._lock:
+                    self._pending[user_id] -= 1
+                    if not self._pending[user_id]:
+                        del self._pending[user_id]
+        return None
+
+    def metrics(self) -> dict:
+        with self._lock:
+            self._global._refill(time.monotonic())
+            return {
+                'allowed': self.allowed,
+                'queued': self.queued,
+                'rejected_user': self.rejected_user,
+                'rejected_global': self.rejected_global,
+                'wait_seconds_total': round(self.wait_seconds, 3),
+                'pending': sum(self._pending.values()),
+                'tracked_users': len(self._users),
+                'global_tokens': round(self._global.tokens, 3),
+                'user_per_minute': self.user_per_minute,
+                'global_per_minute': round(self._global.rate * 60, 3),
+            }
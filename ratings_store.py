@@ -0,0 +1,427 @@
+"""Хранилище пользовательских оценок: SQLite (WAL) или журнал только на дозапись."""
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # Windows: межпроцессной блокировки нет, остаётся блокировка потоков
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+RATINGS_FILE = 'ratings.json'
+# Оценки ставятся кнопками 1-10
+RATING_MIN = 1
+RATING_MAX = 10
+# sqlite — общая база для воркеров gunicorn и бота, log — журнал ratings.log
+RATINGS_BACKEND = os.getenv('RATINGS_BACKEND', 'sqlite')
+# На Vercel код лежит на файловой системе только для чтения — писать можно лишь в /tmp
+RATINGS_DB_FILE = os.getenv('RATINGS_DB_FILE') or ('/tmp/ratings.db' if os.getenv('VERCEL') else 'ratings.db')
+RATINGS_LOG_FILE = os.getenv('RATINGS_LOG_FILE', 'ratings.log')
+# Через сколько дозаписанных голосов журнал сжимается до агрегатов по пиву
+RATINGS_COMPACT_EVERY = int(os.getenv('RATINGS_COMPACT_EVERY', 1000))
+
+
+class _FileLock:
+    """Межпроцессная блокировка на отдельном файле (flock), если она доступна."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._warned = False
+
+    def __enter__(self):
+        if fcntl is not None:
+            try:
+                self._file = open(self.path, 'a')
+            except OSError as e:
+                # Файловая система только для чтения: писать в журнал всё равно
+                # никто не может, поэтому и блокировать нечего
+                if not self._warned:
+                    logger.warning(f"Cannot create lock file {self.path}: {e}")
+                    self._warned = True
+                return self
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+
+
+class RatingsLog:
+    """
+    Каждый голос дописывается строкой в журнал, а в памяти держатся сумма и
+    количество по каждому пиву, так что среднее считается за O(1).
+
+    Формат строк журнала (JSON):
+      {"gen": id}                        — первая строка, меняется при каждом сжатии
+      {"b": имя, "r": оценка}            — один голос
+      {"b": имя, "s": сумма, "n": count} — агрегат после сжатия
+
+    Несколько процессов (воркеры gunicorn, бот) пишут в один файл: перед
+    чтением дочитывается только хвост журнала, дописанный другими; после
+    сжатия другим процессом (новый gen в заголовке) журнал перечитывается целиком.
+    """
+
+    def __init__(self, path=RATINGS_LOG_FILE, legacy_path=RATINGS_FILE, compact_every=RATINGS_COMPACT_EVERY):
+        self.path = path
+        self.legacy_path = legacy_path
+        self.compact_every = compact_every
+        self._lock = threading.Lock()
+        self._file_lock = _FileLock(f'{path}.lock')
+        self._sums = {}
+        self._counts = {}
+        self._generation = None
+        self._offset = 0
+        self._appended = 0
+        with self._lock, self._file_lock:
+            if not os.path.exists(self.path) and os.path.exists(self.legacy_path):
+                self._migrate_legacy()
+            self._refresh()
+
+    def _apply(self, record):
+        if 'gen' in record:
+            return
+        beer = record['b']
+        if 'r' in record:
+            total, count = record['r'], 1
+        else:
+            total, count = record['s'], record['n']
+        self._sums[beer] = self._sums.get(beer, 0) + total
+        self._counts[beer] = self._counts.get(beer, 0) + count
+
+    def _migrate_legacy(self):
+        """Переносит старый ratings.json ({имя: [оценки]}) в журнал агрегатами."""
+        with open(self.legacy_path, encoding='utf-8') as f:
+            legacy = json.load(f)
+        records = [{'b': beer, 's': sum(values), 'n': len(values)} for beer, values in legacy.items() if values]
+        try:
+            self._write_records(records)
+            logger.info(f"Migrated {len(records)} beers from {self.legacy_path} to {self.path}")
+        except OSError as e:
+            # Файловая система только для чтения — работаем с данными в памяти
+            logger.warning(f"Cannot create ratings log {self.path}: {e}")
+            for record in records:
+                self._apply(record)
+
+    def _write_records(self, records):
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'gen': uuid.uuid4().hex}) + '\n')
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        os.replace(tmp_path, self.path)
+
+    def _refresh(self):
+        """Дочитывает новые строки журнала; при смене файла перечитывает его целиком."""
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            # inode может переиспользоваться, поэтому сжатие узнаём по заголовку
+            generation = f.readline()
+            if generation != self._generation:
+                self._sums, self._counts = {}, {}
+                self._generation, self._offset = generation, len(generation)
+            f.seek(self._offset)
+            chunk = f.read()
+        # Неполную последнюю строку (запись ещё идёт) оставляем на потом
+        end = chunk.rfind(b'\n') + 1
+        for line in chunk[:end].splitlines():
+            if line.strip():
+                self._apply(json.loads(line))
+        self._offset += end
+
+    def add(self, beer_name: str, rating: int):
+        self.add_many([(beer_name, rating)])
+
+    def add_many(self, votes):
+        """Дописывает пачку голосов [(имя, оценка), ...] одной записью в файл."""
+        lines = ''.join(json.dumps({'b': beer, 'r': rating}, ensure_ascii=False) + '\n' for beer, rating in votes)
+        with self._lock, self._file_lock:
+            try:
+                if not os.path.exists(self.path):
+                    self._write_records([])
+                self._refresh()
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(lines)
+            except OSError as e:
+                # Журнал недоступен для записи — голоса учитываются только в памяти процесса
+                logger.warning(f"Cannot write ratings log {self.path}: {e}")
+                for beer, rating in votes:
+                    self._apply({'b': beer, 'r': rating})
+                return
+            self._refresh()
+            self._appended += len(votes)
+            if self.compact_every and self._appended >= self.compact_every:
+                self._compact()
+
+    def _compact(self):
+        """Переписывает журнал агрегатами; вызывается под обеими блокировками."""
+        records = [{'b': beer, 's': self._sums[beer], 'n': self._counts[beer]} for beer in self._sums]
+        self._write_records(records)
+        self._refresh()
+        self._appended = 0
+
+    def compact(self):
+        with self._lock, self._file_lock:
+            self._refresh()
+            self._compact()
+
+    def get(self, beer_name: str):
+        """Возвращает (сумма, количество) оценок пива."""
+        with self._lock:
+            self._refresh()
+            return self._sums.get(beer_name, 0), self._counts.get(beer_name, 0)
+
+    def get_many(self, beer_names):
+        """{имя: (сумма, количество)} для пив, у которых есть оценки."""
+        with self._lock:
+            self._refresh()
+            return {name: (self._sums[name], self._counts[name]) for name in beer_names if name in self._counts}
+
+    def all_totals(self):
+        """{имя: (сумма, количество)} по всем оценённым пивам."""
+        with self._lock:
+            self._refresh()
+            return {name: (self._sums[name], self._counts[name]) for name in self._counts}
+
+    def average(self, beer_name: str):
+        total, count = self.get(beer_name)
+        return round(total / count, 2) if count else None
+
+
+class SqliteRatingsStore:
+    """
+    Оценки в SQLite в режиме WAL: читатели не блокируют писателя, поэтому
+    базу безопасно делят воркеры gunicorn и бот. Каждый голос пишется в
+    ratings, а сумма и количество по пиву поддерживаются upsert-ом в
+    rating_totals, так что среднее читается одной строкой без полного прохода.
+    Соединение одно на процесс (после fork открывается заново).
+    """
+
+    # Запросы — константы: sqlite3 кэширует подготовленные выражения по тексту SQL
+    _INSERT_VOTE = 'INSERT INTO ratings (beer, rating, created_at) VALUES (?, ?, ?)'
+    _UPSERT_TOTAL = (
+        'INSERT INTO rating_totals (beer, total, count) VALUES (?, ?, ?) '
+        'ON CONFLICT(beer) DO UPDATE SET total = total + excluded.total, count = count + excluded.count'
+    )
+    _SELECT_TOTAL = 'SELECT total, count FROM rating_totals WHERE beer = ?'
+    _SELECT_ALL_TOTALS = 'SELECT beer, total, count FROM rating_totals'
+    # Ограничение SQLite на число параметров в одном запросе
+    _MAX_PARAMS = 500
+
+    def __init__(self, path=RATINGS_DB_FILE, legacy_path=RATINGS_FILE):
+        self.path = path
+        self.legacy_path = legacy_path
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        with self._lock:
+            conn = self._connection()
+            if self.legacy_path and os.path.exists(self.legacy_path):
+                # Проверка на пустоту и импорт в одной транзакции: воркеры gunicorn,
+                # стартующие одновременно, не импортируют ratings.json дважды
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    if conn.execute('SELECT COUNT(*) FROM rating_totals').fetchone()[0] == 0:
+                        self._import_votes(conn, self.legacy_path)
+                    conn.execute('COMMIT')
+                except BaseException:
+                    conn.execute('ROLLBACK')
+                    raise
+
+    def _connection(self):
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA busy_timeout=10000')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS ratings ('
+                'id INTEGER PRIMARY KEY, beer TEXT NOT NULL, rating INTEGER NOT NULL, created_at REAL NOT NULL)'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS rating_totals ('
+                'beer TEXT PRIMARY KEY, total INTEGER NOT NULL, count INTEGER NOT NULL)'
+            )
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def add(self, beer_name: str, rating: int):
+        self.add_many([(beer_name, rating)])
+
+    def add_many(self, votes):
+        """Записывает пачку голосов [(имя, оценка), ...] одной транзакцией."""
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.executemany(self._INSERT_VOTE, [(beer, rating, now) for beer, rating in votes])
+                conn.executemany(self._UPSERT_TOTAL, [(beer, rating, 1) for beer, rating in votes])
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+
+    def get(self, beer_name: str):
+        """Возвращает (сумма, количество) оценок пива."""
+        with self._lock:
+            row = self._connection().execute(self._SELECT_TOTAL, (beer_name,)).fetchone()
+        return (row[0], row[1]) if row else (0, 0)
+
+    def get_many(self, beer_names):
+        """{имя: (сумма, количество)} для пив, у которых есть оценки."""
+        names = list(dict.fromkeys(beer_names))
+        result = {}
+        with self._lock:
+            conn = self._connection()
+            for start in range(0, len(names), self._MAX_PARAMS):
+                chunk = names[start:start + self._MAX_PARAMS]
+                placeholders = ','.join('?' * len(chunk))
+                rows = conn.execute(
+                    f'SELECT beer, total, count FROM rating_totals WHERE beer IN ({placeholders})', chunk
+                )
+                result.update((beer, (total, count)) for beer, total, count in rows)
+        return result
+
+    def all_totals(self):
+        """{имя: (сумма, количество)} по всем оценённым пивам."""
+        with self._lock:
+            rows = self._connection().execute(self._SELECT_ALL_TOTALS).fetchall()
+        return {beer: (total, count) for beer, total, count in rows}
+
+    def average(self, beer_name: str):
+        total, count = self.get(beer_name)
+        return round(total / count, 2) if count else None
+
+    def compact(self):
+        """Переносит WAL в основной файл базы."""
+        with self._lock:
+            self._connection().execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+    def _import_votes(self, conn, path):
+        """Записывает ratings.json ({имя: [оценки]}) в базу; вызывается внутри открытой транзакции."""
+        with open(path, encoding='utf-8') as f:
+            legacy = json.load(f)
+        now = time.time()
+        votes = [(beer, int(rating), now) for beer, values in legacy.items() for rating in values]
+        totals = [(beer, sum(values), len(values)) for beer, values in legacy.items() if values]
+        conn.executemany(self._INSERT_VOTE, votes)
+        conn.executemany(self._UPSERT_TOTAL, totals)
+        logger.info(f"Imported {len(votes)} ratings for {len(totals)} beers from {path} into {self.path}")
+        return len(votes)
+
+    def import_legacy(self, path=RATINGS_FILE):
+        """Однократный импорт ratings.json ({имя: [оценки]}); возвращает число голосов."""
+        with self._lock:
+            conn = self._connection()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                imported = self._import_votes(conn, path)
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+        return imported
+
+
+class MemoryRatingsStore:
+    """
+    Оценки только в памяти процесса, начальные — из ratings.json. Запасной
+    вариант, когда файл базы или журнала создать нельзя (файловая система
+    только для чтения): чтение рейтингов при распознавании продолжает работать,
+    новые оценки живут до перезапуска процесса.
+    """
+
+    def __init__(self, legacy_path=RATINGS_FILE):
+        self._lock = threading.Lock()
+        self._sums = {}
+        self._counts = {}
+        if legacy_path and os.path.exists(legacy_path):
+            with open(legacy_path, encoding='utf-8') as f:
+                legacy = json.load(f)
+            for beer, values in legacy.items():
+                if values:
+                    self._sums[beer] = sum(values)
+                    self._counts[beer] = len(values)
+
+    def add(self, beer_name: str, rating: int):
+        self.add_many([(beer_name, rating)])
+
+    def add_many(self, votes):
+        with self._lock:
+            for beer, rating in votes:
+                self._sums[beer] = self._sums.get(beer, 0) + rating
+                self._counts[beer] = self._counts.get(beer, 0) + 1
+
+    def get(self, beer_name: str):
+        """Возвращает (сумма, количество) оценок пива."""
+        with self._lock:
+            return self._sums.get(beer_name, 0), self._counts.get(beer_name, 0)
+
+    def get_many(self, beer_names):
+        """{имя: (сумма, количество)} для пив, у которых есть оценки."""
+        with self._lock:
+            return {name: (self._sums[name], self._counts[name]) for name in beer_names if name in self._counts}
+
+    def all_totals(self):
+        """{имя: (сумма, количество)} по всем оценённым пивам."""
+        with self._lock:
+            return {name: (self._sums[name], self._counts[name]) for name in self._counts}
+
+    def average(self, beer_name: str):
+        total, count = self.get(beer_name)
+        return round(total / count, 2) if count else None
+
+    def compact(self):
+        pass
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_ratings_store():
+    """Общее для процесса хранилище оценок (RATINGS_BACKEND: sqlite или log)."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                try:
+                    if RATINGS_BACKEND == 'log':
+                        _store = RatingsLog()
+                    else:
+                        _store = SqliteRatingsStore()
+                except (sqlite3.Error, OSError) as e:
+                    # Без хранилища рейтинги всё равно нужны для ответа на фото —
+                    # не даём этой ошибке ломать распознавание
+                    logger.warning(f"Ratings storage unavailable ({e}), using read-only in-memory ratings")
+                    _store = MemoryRatingsStore()
+    return _store
+
+
+if __name__ == '__main__':
+    # python ratings_store.py import [ratings.json] [--force] — однократный перенос оценок в SQLite
+    args = [arg for arg in sys.argv[1:] if arg != '--force']
+    if not args or args[0] != 'import':
+        print('Usage: python ratings_store.py import [ratings.json] [--force]')
+        sys.exit(1)
+    logging.basicConfig(level=logging.INFO)
+    source = args[1] if len(args) > 1 else RATINGS_FILE
+    store = SqliteRatingsStore(legacy_path=None)
+    if store._connection().execute('SELECT COUNT(*) FROM rating_totals').fetchone()[0] and '--force' not in sys.argv:
+        print(f'{store.path} уже содержит оценки; повторный импорт задвоит их (используйте --force)')
+        sys.exit(1)
+    print(f'Импортировано оценок: {store.import_legacy(source)}')
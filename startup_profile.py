@@ -0,0 +1,111 @@
+"""
+Инструментирование холодного старта: время импорта каждого модуля и время
+до первого ответа. Включается STARTUP_PROFILE=1; модуль нужно импортировать
+первым, до остальных зависимостей (так его импортирует api/bot.py).
+
+    STARTUP_PROFILE=1 flask --app api/bot.py run   # или STARTUP_PROFILE=1 в окружении Vercel
+    GET /stats -> "startup": {...}
+"""
+import builtins
+import logging
+import os
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+STARTUP_PROFILE = os.getenv('STARTUP_PROFILE', '').lower() in ('1', 'true', 'yes')
+# Сколько самых медленных модулей выводить в отчёте
+STARTUP_PROFILE_TOP = int(os.getenv('STARTUP_PROFILE_TOP', 25))
+
+# Отсчёт от загрузки этого модуля — первой строки приложения
+_started = time.perf_counter()
+
+
+class ImportProfiler:
+    """
+    Обёртка над builtins.__import__: для каждого модуля, загруженного впервые,
+    запоминает полное время импорта и собственное (без вложенных импортов).
+    """
+
+    def __init__(self):
+        self.modules = {}
+        self.first_response = None
+        self._original = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def install(self):
+        if self._original is None:
+            self._original = builtins.__import__
+            builtins.__import__ = self._import
+
+    def uninstall(self):
+        if self._original is not None:
+            builtins.__import__ = self._original
+            self._original = None
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level or name in sys.modules:
+            return self._original(name, globals, locals, fromlist, level)
+        stack = self._local.__dict__.setdefault('stack', [])
+        stack.append(0.0)
+        started = time.perf_counter()
+        try:
+            return self._original(name, globals, locals, fromlist, level)
+        finally:
+            total = time.perf_counter() - started
+            nested = stack.pop()
+            if stack:
+                stack[-1] += total
+            with self._lock:
+                self.modules.setdefault(name, (total, total - nested))
+
+    def mark_first_response(self, label):
+        """Отмечает первый отданный ответ процесса; повторные вызовы ничего не делают."""
+        with self._lock:
+            if self.first_response is not None:
+                return
+            self.first_response = (label, time.perf_counter() - _started)
+        # После первого ответа холодный старт закончился — снимаем обёртку
+        self.uninstall()
+        logger.info(self.format_report())
+
+    def report(self) -> dict:
+        with self._lock:
+            modules = sorted(self.modules.items(), key=lambda item: item[1][0], reverse=True)
+            first_response = self.first_response
+        return {
+            'since_start_ms': round((time.perf_counter() - _started) * 1000, 1),
+            'first_response': {'label': first_response[0], 'ms': round(first_response[1] * 1000, 1)}
+            if first_response else None,
+            'imports': [
+                {'module': name, 'total_ms': round(total * 1000, 1), 'self_ms': round(own * 1000, 1)}
+                for name, (total, own) in modules[:STARTUP_PROFILE_TOP]
+            ],
+        }
+
+    def format_report(self) -> str:
+        report = self.report()
+        lines = ['Startup profile:']
+        if report['first_response']:
+            lines.append(f"  time to first response ({report['first_response']['label']}): "
+                         f"{report['first_response']['ms']} ms")
+        for item in report['imports']:
+            lines.append(f"  {item['total_ms']:>9.1f} ms total {item['self_ms']:>9.1f} ms self  {item['module']}")
+        return '\n'.join(lines)
+
+
+profiler = ImportProfiler()
+if STARTUP_PROFILE:
+    profiler.install()
+
+
+def mark_first_response(label):
+    if STARTUP_PROFILE:
+        profiler.mark_first_response(label)
+
+
+def stats():
+    return profiler.report() if STARTUP_PROFILE else None
@@ -0,0 +1,45 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import api  # noqa: E402
+import ratings_store  # noqa: E402
+from leaderboard import Leaderboard  # noqa: E402
+
+
+@pytest.fixture
+def store(monkeypatch):
+    # Оценки только в памяти: тест не трогает ratings.db и ratings.json
+    store = ratings_store.MemoryRatingsStore(legacy_path=None)
+    monkeypatch.setattr(ratings_store, '_store', store)
+    monkeypatch.setattr(api, 'leaderboard', Leaderboard(store, api.catalog_base_ratings))
+    return store
+
+
+@pytest.fixture
+def client(store):
+    return api.app.test_client()
+
+
+@pytest.mark.parametrize('rating', [0, 11, -1, 10 ** 9, True, False, 5.0, '5', None])
+def test_post_rating_rejects_invalid(client, store, rating):
+    response = client.post('/rating', json={'beer': 'Corona', 'rating': rating})
+    assert response.status_code == 400
+    assert store.all_totals() == {}
+
+
+@pytest.mark.parametrize('rating', [0, 11, 10 ** 9, True, False])
+def test_post_ratings_rejects_batch_with_invalid(client, store, rating):
+    items = [{'beer': 'Corona', 'rating': 7}, {'beer': 'Corona', 'rating': rating}]
+    response = client.post('/ratings', json={'ratings': items})
+    assert response.status_code == 400
+    assert store.all_totals() == {}
+
+
+def test_post_ratings_accepts_bounds(client, store):
+    items = [{'beer': 'Corona', 'rating': 1}, {'beer': 'Corona', 'rating': 10}]
+    response = client.post('/ratings', json={'ratings': items})
+    assert response.status_code == 200
+    assert store.all_totals() == {'Corona': (11, 2)}
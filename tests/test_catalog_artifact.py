@@ -0,0 +1,49 @@
+import hashlib
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import catalog  # noqa: E402
+
+# Результат вывода снимка на BEERS, закреплённый за catalog.CATALOG_DERIVATION.
+# Если тест упал после изменения clean_name, sku_id/product_key, индекса или
+# карточек — поднимите CATALOG_DERIVATION и запишите сюда новые значения:
+# иначе бот загрузит артефакт, собранный старым кодом.
+PINNED_DERIVATION = 2
+PINNED_FINGERPRINT = 'eb67e4385464afba862870f5c5fc88f1c93213220d5ab4acdde2edf4a914282c'
+
+BEERS = [
+    {'name': 'Пиво Corona Extra светлое, 0.355л', 'brand': 'Corona', 'abv': '4.5', 'rating': '7'},
+    {'name': 'Пиво Heineken светлое 0,5 л', 'url': 'https://online.metro-cc.ru/products/heineken/?utm_source=x'},
+    {'name': 'Сидр Strongbow Gold', 'id': 'Сидр Strongbow Gold', 'url': 'https://online.metro-cc.ru/products/strongbow'},
+]
+
+
+def derivation_fingerprint():
+    snapshot = catalog._Snapshot(BEERS, None)
+    snapshot.render_cards()
+    derived = {
+        'ids': snapshot.ids,
+        'clean_names': snapshot.clean_names,
+        'cards': snapshot.cards,
+        'tokens': sorted(snapshot.index.tokens.slots),
+        'grams': sorted(snapshot.index.grams.slots),
+    }
+    return hashlib.sha256(json.dumps(derived, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def test_derivation_version_is_pinned():
+    assert (catalog.CATALOG_DERIVATION, derivation_fingerprint()) == (PINNED_DERIVATION, PINNED_FINGERPRINT)
+
+
+def test_artifact_from_other_derivation_is_ignored(tmp_path, monkeypatch):
+    path = tmp_path / 'beer_db.json'
+    path.write_text(json.dumps(BEERS, ensure_ascii=False), encoding='utf-8')
+    monkeypatch.setattr(catalog, 'CATALOG_ARTIFACT', '')
+    catalog.compile_catalog(str(path))
+    digest = hashlib.sha256(path.read_bytes()).hexdigest()
+    assert catalog._load_artifact(str(path), digest) is not None
+
+    monkeypatch.setattr(catalog, 'CATALOG_DERIVATION', catalog.CATALOG_DERIVATION + 1)
+    assert catalog._load_artifact(str(path), digest) is None
@@ -0,0 +1,32 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from leaderboard import Leaderboard  # noqa: E402
+from ratings_store import MemoryRatingsStore  # noqa: E402
+
+
+def make_leaderboard(votes):
+    store = MemoryRatingsStore(legacy_path=None)
+    store.add_many(votes)
+    catalog = {'Corona': '7', 'Heineken': ''}
+    return store, Leaderboard(store, lambda: catalog, min_votes=1, prior_weight=1)
+
+
+def test_names_outside_catalog_are_not_ranked():
+    spam = '<script>spam</script>'
+    store, leaderboard = make_leaderboard([(spam, 10 ** 9)] * 3 + [('Corona', 8)])
+    assert [row['beer'] for row in leaderboard.top()] == ['Corona']
+
+    votes = [(spam, 10), ('Heineken', 6)]
+    store.add_many(votes)
+    leaderboard.record(votes)
+    assert [row['beer'] for row in leaderboard.top()] == ['Corona', 'Heineken']
+
+
+def test_out_of_range_votes_are_skipped():
+    store, leaderboard = make_leaderboard([('Corona', 8), ('Heineken', 10 ** 9)])
+    assert [row['beer'] for row in leaderboard.top()] == ['Corona']
+
+    leaderboard.record([('Corona', 10 ** 9)])
+    assert leaderboard.top()[0]['votes'] == 1
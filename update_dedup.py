@@ -0,0 +1,88 @@
+"""Идемпотентность: отбрасываем повторные доставки update-ов Telegram по update_id и id callback-запроса."""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+DEDUP_MAX_ENTRIES = int(os.getenv('DEDUP_MAX_ENTRIES', 10000))
+# Telegram повторяет доставку не дольше суток; по умолчанию храним час
+DEDUP_TTL = float(os.getenv('DEDUP_TTL', 3600))
+# SQLite-файл, чтобы помнить обработанные update-ы после перезапуска; пусто — только память
+DEDUP_DB_FILE = os.getenv('DEDUP_DB_FILE', '')
+# Как часто (в отметках) чистить устаревшие строки в SQLite
+DEDUP_CLEANUP_EVERY = 500
+
+
+class UpdateDeduplicator:
+    """
+    Ограниченное по размеру и времени множество уже принятых ключей.
+    С path ключи дополнительно пишутся в SQLite: INSERT OR IGNORE атомарен,
+    так что дубликат распознаётся и другим процессом, и после перезапуска.
+    """
+
+    def __init__(self, max_entries=DEDUP_MAX_ENTRIES, ttl=DEDUP_TTL, path=DEDUP_DB_FILE):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self._seen = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self._marks = 0
+        self.duplicates = 0
+
+    def _connection(self):
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS seen_updates (key TEXT PRIMARY KEY, seen_at REAL NOT NULL)')
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def _expire(self, now):
+        while self._seen:
+            key, seen_at = next(iter(self._seen.items()))
+            if len(self._seen) <= self.max_entries and now - seen_at <= self.ttl:
+                break
+            self._seen.popitem(last=False)
+
+    def check_and_mark(self, key: str) -> bool:
+        """Отмечает ключ; возвращает True, если он уже был (это дубликат)."""
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            duplicate = key in self._seen
+            if not duplicate and self.path:
+                conn = self._connection()
+                self._marks += 1
+                if self._marks % DEDUP_CLEANUP_EVERY == 0:
+                    conn.execute('DELETE FROM seen_updates WHERE seen_at < ?', (now - self.ttl,))
+                cursor = conn.execute(
+                    'INSERT OR IGNORE INTO seen_updates (key, seen_at) VALUES (?, ?)', (key, now)
+                )
+                if cursor.rowcount == 0:
+                    row = conn.execute('SELECT seen_at FROM seen_updates WHERE key = ?', (key,)).fetchone()
+                    duplicate = row is not None and now - row[0] <= self.ttl
+                    if not duplicate:
+                        # Запись устарела (или её только что удалили) — отмечаем заново
+                        conn.execute('INSERT OR REPLACE INTO seen_updates (key, seen_at) VALUES (?, ?)', (key, now))
+            if duplicate:
+                self.duplicates += 1
+            else:
+                self._seen[key] = now
+            return duplicate
+
+    def forget(self, key: str):
+        """Снимает отметку, например если update не приняли и Telegram пришлёт его снова."""
+        with self._lock:
+            self._seen.pop(key, None)
+            if self.path:
+                self._connection().execute('DELETE FROM seen_updates WHERE key = ?', (key,))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'entries': len(self._seen), 'duplicates': self.duplicates}
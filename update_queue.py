@@ -0,0 +1,105 @@
+"""Ограниченная очередь update-ов с пулом асинхронных воркеров для быстрого ответа на вебхук."""
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# sync — вебхук ждёт полной обработки (нужно для Vercel: после ответа контейнер замораживается),
+# queue — вебхук кладёт update в очередь и сразу отвечает 'ok' (для постоянно работающего сервера)
+WEBHOOK_MODE = os.getenv('WEBHOOK_MODE', 'sync')
+UPDATE_QUEUE_SIZE = int(os.getenv('UPDATE_QUEUE_SIZE', 100))
+UPDATE_WORKERS = int(os.getenv('UPDATE_WORKERS', 4))
+# Что делать при переполнении:
+#   drop_new    — подтвердить и отбросить новый update,
+#   drop_oldest — вытеснить самый старый из очереди,
+#   retry       — ответить 503, чтобы Telegram доставил update позже
+UPDATE_SHED_POLICY = os.getenv('UPDATE_SHED_POLICY', 'retry')
+# Должно быть меньше таймаута хуков остановки в bot_runtime (10 с)
+UPDATE_DRAIN_TIMEOUT = float(os.getenv('UPDATE_DRAIN_TIMEOUT', 8))
+
+# Результаты put()
+ACCEPTED = 'accepted'
+SHED = 'shed'
+RETRY = 'retry'
+
+
+class UpdateQueue:
+    """
+    asyncio.Queue фиксированного размера и N воркеров, вызывающих handler(item).
+    Все методы выполняются в одном event loop (фоновом цикле runtime).
+    """
+
+    def __init__(self, handler, maxsize=UPDATE_QUEUE_SIZE, workers=UPDATE_WORKERS, policy=UPDATE_SHED_POLICY):
+        if policy not in ('drop_new', 'drop_oldest', 'retry'):
+            raise ValueError(f'Unknown shed policy: {policy}')
+        self.handler = handler
+        self.maxsize = maxsize
+        self.workers = workers
+        self.policy = policy
+        self._queue = None
+        self._tasks = []
+        self._closing = False
+        self.processed = 0
+        self.failed = 0
+        self.shed = 0
+
+    def _ensure_started(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue(self.maxsize)
+            self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+
+    async def _worker(self, number):
+        while True:
+            item = await self._queue.get()
+            try:
+                await self.handler(item)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Update worker {number} failed: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def put(self, item) -> str:
+        """Ставит update в очередь; возвращает ACCEPTED, SHED или RETRY."""
+        if self._closing:
+            return RETRY
+        self._ensure_started()
+        if self._queue.full():
+            if self.policy == 'retry':
+                return RETRY
+            self.shed += 1
+            if self.policy == 'drop_new':
+                logger.warning("Update queue full, dropping new update")
+                return SHED
+            dropped = self._queue.get_nowait()
+            self._queue.task_done()
+            logger.warning(f"Update queue full, dropped oldest update {dropped.get('update_id')}")
+        self._queue.put_nowait(item)
+        return ACCEPTED
+
+    async def drain(self, timeout=UPDATE_DRAIN_TIMEOUT):
+        """Перестаёт принимать update-ы, дожидается обработки очереди и останавливает воркеров."""
+        self._closing = True
+        if self._queue is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Update queue drain timed out with {self._queue.qsize()} updates left")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> dict:
+        return {
+            'size': self._queue.qsize() if self._queue is not None else 0,
+            'maxsize': self.maxsize,
+            'workers': self.workers,
+            'policy': self.policy,
+            'processed': self.processed,
+            'failed': self.failed,
+            'shed': self.shed,
+        }
@@ -0,0 +1,39 @@
+"""Проверка initData мини-приложения Telegram (подпись HMAC-SHA256 от токена бота)."""
+import hashlib
+import hmac
+import json
+import os
+import time
+from urllib.parse import parse_qsl
+
+# Сколько секунд initData считается действительной после выдачи Telegram
+WEBAPP_INIT_DATA_TTL = int(os.getenv('WEBAPP_INIT_DATA_TTL', 24 * 3600))
+
+
+def verify_init_data(init_data: str, bot_token: str, max_age=WEBAPP_INIT_DATA_TTL):
+    """
+    Проверяет строку window.Telegram.WebApp.initData по алгоритму из
+    документации Telegram. Возвращает пользователя (dict с id) или None,
+    если подпись неверна, данные устарели или пользователя в них нет.
+    """
+    if not init_data or not bot_token:
+        return None
+    fields = dict(parse_qsl(init_data, keep_blank_values=True))
+    received_hash = fields.pop('hash', None)
+    if not received_hash:
+        return None
+    data_check_string = '\n'.join(f'{key}={value}' for key, value in sorted(fields.items()))
+    secret_key = hmac.new(b'WebAppData', bot_token.encode('utf-8'), hashlib.sha256).digest()
+    expected_hash = hmac.new(secret_key, data_check_string.encode('utf-8'), hashlib.sha256).hexdigest()
+    if not hmac.compare_digest(expected_hash, received_hash):
+        return None
+    try:
+        auth_date = int(fields.get('auth_date', 0))
+        user = json.loads(fields.get('user', 'null'))
+    except ValueError:
+        return None
+    if max_age and time.time() - auth_date > max_age:
+        return None
+    if not isinstance(user, dict) or not isinstance(user.get('id'), int):
+        return None
+    return user